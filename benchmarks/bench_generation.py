@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""
+Benchmarks for pipeline generation at monorepo scale.
+
+Synthetic targets, Command class hierarchies, pipelines and diffs are generated
+from a fixed seed, and the time and peak memory of each generation phase
+(construction, filtered, steps, asdict, asyaml) are reported separately.
+
+Usage: script/benchmark [--steps 1000 5000 20000] [--paths 10000] [--json]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+from kitefly import Command, GitFilter, Group, Pipeline, Target, Wait  # noqa: E402
+from kitefly.util import KEY_COUNT  # noqa: E402
+from test_git_filter import GitMocked  # noqa: E402
+
+PHASES = ("construction", "filtered", "steps", "asdict", "asyaml")
+EXTENSIONS = ("py", "ts", "go", "md", "json", "proto", "yaml")
+
+
+def generate_targets(rng: random.Random, count: int, max_deps: int) -> List[Target]:
+    """
+    Generate targets with a mix of directory prefixes, recursive globs and extension
+    globs, each depending on up to max_deps earlier targets.
+    """
+    targets: List[Target] = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            sources = [f"services/svc_{i}", f"services/svc_{i}-proto"]
+        elif kind == 1:
+            sources = [f"libs/lib_{i}/**"]
+        elif kind == 2:
+            sources = [f"services/svc_{i - 2}/**/*.{rng.choice(EXTENSIONS)}"]
+        else:
+            sources = [f"**/*_{i}.{rng.choice(EXTENSIONS)}", f"config/{i}/*.yaml"]
+        target = Target(sources, priority=rng.randint(0, 3), name=f"t{i}")
+        for dep in rng.sample(targets, min(len(targets), rng.randint(0, max_deps))):
+            target >> dep
+        targets.append(target)
+    return targets
+
+
+def generate_classes(rng: random.Random, count: int) -> List[type]:
+    """
+    Generate a hierarchy of Command subclasses with class-level defaults.
+    """
+    classes: List[type] = [Command]
+    for i in range(count):
+        parent = rng.choice(classes)
+        attrs = {
+            "env": {f"VAR_{i}": str(i)},
+            "agents": {"queue": f"queue-{i % 5}"},
+            "artifact_paths": [f"artifacts/{i}/**"],
+        }
+        classes.append(type(f"Command{i}", (parent,), attrs))
+    return classes
+
+
+def generate_pipeline(
+    rng: random.Random,
+    steps: int,
+    targets: List[Target],
+    classes: List[type],
+    group_size: int,
+) -> Pipeline:
+    items = []
+    group: list = []
+    previous = None
+    for i in range(steps):
+        cls = rng.choice(classes)
+        step = cls(
+            f"Step {i}",
+            f"script/run.sh {i}",
+            targets=rng.sample(targets, rng.randint(1, 3)),
+            env={"SHARD": str(i)},
+        )
+        if previous is not None and rng.random() < 0.1:
+            step >> previous
+        previous = step
+        group.append(step)
+        if len(group) == group_size:
+            items.append(Group(group, label=f"Group {i}"))
+            group = []
+            if rng.random() < 0.2:
+                items.append(Wait())
+    items += group
+    return Pipeline(items)
+
+
+def generate_paths(rng: random.Random, count: int, targets: int) -> List[str]:
+    paths = []
+    for i in range(count):
+        n = rng.randrange(targets * 2)
+        top = rng.choice(("services/svc_", "libs/lib_", "config/", "vendor/pkg_"))
+        depth = "/".join(f"d{rng.randrange(10)}" for _ in range(rng.randint(0, 4)))
+        name = f"file_{i}.{rng.choice(EXTENSIONS)}"
+        paths.append("/".join(p for p in (f"{top}{n}", depth, name) if p))
+    return paths
+
+
+def run_phases(args: argparse.Namespace, steps: int) -> Dict[str, Callable[[], object]]:
+    """
+    Return callables for each phase, which must be called in order.
+    """
+    rng = random.Random(args.seed)
+    state: dict = {}
+
+    def construction() -> object:
+        KEY_COUNT.clear()
+        state["targets"] = generate_targets(rng, args.targets, args.max_deps)
+        state["classes"] = generate_classes(rng, args.classes)
+        state["pipeline"] = generate_pipeline(
+            rng, steps, state["targets"], state["classes"], args.group_size
+        )
+        state["paths"] = generate_paths(rng, args.paths, args.targets)
+        return state["pipeline"]
+
+    def filtered() -> object:
+        with GitMocked(state["paths"]):
+            state["filtered"] = state["pipeline"].filtered(GitFilter("main"))
+        return state["filtered"]
+
+    return {
+        "construction": construction,
+        "filtered": filtered,
+        "steps": lambda: state["filtered"].steps,
+        "asdict": lambda: state["filtered"].asdict(),
+        "asyaml": lambda: state["filtered"].asyaml(),
+    }
+
+
+def measure(args: argparse.Namespace, steps: int) -> Dict[str, Tuple[float, int]]:
+    """
+    Return the best time (seconds) and peak memory (bytes) of each phase. Timings
+    and memory are taken from separate runs, since tracing allocations slows
+    execution down considerably.
+    """
+    times: Dict[str, float] = {}
+    for _ in range(args.repeat):
+        phases = run_phases(args, steps)
+        for name in PHASES:
+            gc.collect()
+            start = time.perf_counter()
+            phases[name]()
+            elapsed = time.perf_counter() - start
+            times[name] = min(times.get(name, elapsed), elapsed)
+
+    peaks: Dict[str, int] = {}
+    phases = run_phases(args, steps)
+    tracemalloc.start()
+    try:
+        for name in PHASES:
+            gc.collect()
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            phases[name]()
+            peaks[name] = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return {name: (times[name], peaks[name]) for name in PHASES}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--steps", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--targets", type=int, default=500)
+    parser.add_argument("--max-deps", type=int, default=3)
+    parser.add_argument("--classes", type=int, default=40)
+    parser.add_argument("--group-size", type=int, default=25)
+    parser.add_argument("--paths", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="output JSON results")
+    args = parser.parse_args()
+
+    results = {steps: measure(args, steps) for steps in args.steps}
+    if args.json:
+        print(json.dumps({
+            str(steps): {
+                name: {"seconds": t, "peak_bytes": m} for name, (t, m) in phases.items()
+            }
+            for steps, phases in results.items()
+        }, indent=2))
+        return
+    print(
+        f"targets={args.targets} classes={args.classes} paths={args.paths}"
+        f" group_size={args.group_size}"
+    )
+    print(f"{'steps':>7} {'phase':<13} {'time (s)':>10} {'peak (MiB)':>11}")
+    for steps, phases in results.items():
+        for name, (seconds, peak) in phases.items():
+            print(f"{steps:>7} {name:<13} {seconds:>10.3f} {peak / 2 ** 20:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
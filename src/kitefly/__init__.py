@@ -2,3 +2,5 @@ __version__ = "0.1.0"
 
 from .model import *
 from .filter import *
+from .util import KeyRegistry, key_scope
+from .render_cache import DiskRenderCache, RenderCache
@@ -0,0 +1,240 @@
+"""
+Command line interface, installed as `kitefly` (or run as `python -m kitefly`).
+
+    kitefly query DEFINITION [PATH ...]
+
+reports the steps of the pipeline defined in DEFINITION which would run for the given
+changed files. With --git, the files changed relative to the base branch are used.
+With --stdin, each line of input is a JSON list of changed files, answered by a line
+of JSON, and with --socket the same protocol is served on a Unix socket, so that the
+definition is loaded and indexed only once for many queries.
+
+    kitefly serve DEFINITION --socket PATH
+    kitefly render --socket PATH [DEFINITION]
+
+keep the pipeline defined in DEFINITION loaded in a server process (see kitefly.serve),
+and print its YAML from the server, in place of running the definition in each build.
+If the server can't be reached, render runs DEFINITION in-process instead.
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional, Sequence, TextIO
+
+from .filter.git_filter import GitFilter
+from .query import AffectedStep, PipelineQuery, load_pipeline, pattern_source, query_result
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = _parser()
+    args = parser.parse_args(argv)
+    if not hasattr(args, "command"):
+        parser.print_help()
+        return 2
+    return args.command(args)
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="kitefly")
+    commands = parser.add_subparsers(title="commands")
+
+    query = commands.add_parser(
+        "query",
+        help="report the steps which would run for a set of changed files",
+        description="Report the steps which would run for a set of changed files, with "
+        "the files, Targets and patterns which selected them.",
+    )
+    query.add_argument("definition", help="python file defining the pipeline")
+    query.add_argument("paths", nargs="*", help="changed files, relative to the repository root")
+    query.add_argument(
+        "--name",
+        default="pipeline",
+        help="variable (or function) holding the Pipeline (default: %(default)s)",
+    )
+    query.add_argument(
+        "--all-targets",
+        dest="exclusive",
+        action="store_false",
+        help="select steps when any of their Targets match, not only the owning Target",
+    )
+    query.add_argument("--json", action="store_true", help="print the result as JSON")
+    sources = query.add_mutually_exclusive_group()
+    sources.add_argument(
+        "--git",
+        action="store_true",
+        help="query the files changed relative to the base branch",
+    )
+    sources.add_argument(
+        "--stdin",
+        action="store_true",
+        help="answer a JSON list of paths on each line of input with a line of JSON",
+    )
+    sources.add_argument(
+        "--socket",
+        metavar="PATH",
+        help="answer JSON lines queries on a Unix socket until interrupted",
+    )
+    query.add_argument(
+        "--base-branch",
+        default="",
+        help="base branch for --git (default: BUILDKITE_PULL_REQUEST_BASE_BRANCH)",
+    )
+    query.set_defaults(command=_query)
+
+    serve = commands.add_parser(
+        "serve",
+        help="keep a pipeline definition loaded, and render it on request",
+    )
+    serve.add_argument("definition", help="python file defining the pipeline")
+    serve.add_argument("--socket", metavar="PATH", required=True, help="Unix socket to listen on")
+    serve.add_argument(
+        "--name",
+        default="pipeline",
+        help="variable (or function) holding the Pipeline (default: %(default)s)",
+    )
+    serve.set_defaults(command=_serve)
+
+    render = commands.add_parser(
+        "render",
+        help="print the pipeline rendered by a server, or by DEFINITION if it isn't running",
+    )
+    render.add_argument(
+        "definition", nargs="?", default="", help="python file defining the pipeline"
+    )
+    render.add_argument(
+        "--socket", metavar="PATH", required=True, help="Unix socket of the server"
+    )
+    render.add_argument(
+        "--name",
+        default="pipeline",
+        help="variable (or function) holding the Pipeline (default: %(default)s)",
+    )
+    render.add_argument(
+        "--base-branch",
+        default=os.environ.get("BUILDKITE_PULL_REQUEST_BASE_BRANCH", ""),
+        help="filter steps against files changed relative to this branch "
+        "(default: BUILDKITE_PULL_REQUEST_BASE_BRANCH)",
+    )
+    render.add_argument("--format", choices=("yaml", "json"), default="yaml")
+    render.add_argument(
+        "--timeout", type=float, default=60.0, help="seconds to wait for the server"
+    )
+    render.set_defaults(command=_render)
+    return parser
+
+
+def _query(args: argparse.Namespace) -> int:
+    pipeline_query = PipelineQuery(load_pipeline(args.definition, args.name), args.exclusive)
+    if args.stdin:
+        answer_lines(pipeline_query, sys.stdin, sys.stdout)
+        return 0
+    if args.socket:
+        from .unix_socket import serve
+
+        try:
+            serve(args.socket, lambda message: _answer(pipeline_query, message))
+        except KeyboardInterrupt:
+            pass
+        return 0
+    paths: List[str] = list(args.paths)
+    if args.git:
+        git_filter = GitFilter(args.base_branch)
+        if not git_filter.base_branch:
+            print("kitefly: --git requires a base branch", file=sys.stderr)
+            return 2
+        paths += git_filter.changed_files()
+    steps = pipeline_query.query(paths)
+    if args.json:
+        print(json.dumps(query_result(steps), indent=2))
+    else:
+        print(format_steps(steps), end="")
+    return 0
+
+
+def _serve(args: argparse.Namespace) -> int:
+    from .serve import PipelineServer
+    from .unix_socket import serve
+
+    server = PipelineServer(args.definition, args.name)
+    # Load up-front, so that errors in the definition are reported immediately
+    server.load()
+    try:
+        serve(args.socket, server.handle)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _render(args: argparse.Namespace) -> int:
+    from .serve import PipelineServer, head_commit
+    from .unix_socket import request
+
+    # The server filters against this checkout, and rejects the request if it can't
+    message = {
+        "command": "render",
+        "base_branch": args.base_branch,
+        "format": args.format,
+        "cwd": os.getcwd(),
+        "head": head_commit(),
+        "definition": os.path.abspath(args.definition) if args.definition else "",
+    }
+    try:
+        response = request(args.socket, message, timeout=args.timeout)
+    except OSError as e:
+        # Rendered in-process, as for a mismatched checkout
+        response = {"error": f"can't reach server at {args.socket}: {e}", "mismatch": True}
+    if "error" in response:
+        print(f"kitefly: {response['error']}", file=sys.stderr)
+        if not (args.definition and response.get("mismatch")):
+            return 1
+        print(f"kitefly: rendering {args.definition} in-process", file=sys.stderr)
+        server = PipelineServer(args.definition, args.name)
+        output = server.render(args.base_branch, args.format)
+    else:
+        output = response["output"]
+    sys.stdout.write(output)
+    if not output.endswith("\n"):
+        sys.stdout.write("\n")
+    return 0
+
+
+def answer_lines(pipeline_query: PipelineQuery, lines: TextIO, output: TextIO) -> None:
+    """
+    Answer each line of input, a JSON list of paths, with a line of JSON.
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            response = _answer(pipeline_query, json.loads(line))
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        output.write(json.dumps(response) + "\n")
+        output.flush()
+
+
+def _answer(pipeline_query: PipelineQuery, message: Any) -> Dict[str, Any]:
+    paths = message.get("paths") if isinstance(message, dict) else message
+    if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+        raise ValueError("Expected a list of paths")
+    return query_result(pipeline_query.query(paths))
+
+
+def format_steps(steps: List[AffectedStep]) -> str:
+    """
+    Format the result of a query for reading.
+    """
+    lines = []
+    for step in steps:
+        lines.append(f"{step.key}  {step.label}".rstrip())
+        for match in step.matches:
+            target = match.target.name or str(match.target)
+            lines.append(f"    {match.path} -> {target} ({pattern_source(match.pattern)})")
+        if step.dependent_of:
+            lines.append(f"    depends on {', '.join(step.dependent_of)}")
+    return "".join(f"{line}\n" for line in lines)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,19 @@
+from kitefly.filter.changed_files_cache import ChangedFilesCache, DiskChangedFilesCache
+from kitefly.filter.composite import And, CompositeFilter, Not, Or
 from kitefly.filter.filter import Filter
 from kitefly.filter.git_filter import GitFilter
 from kitefly.filter.noop_filter import NoopFilter
+from kitefly.filter.tag_filter import TagFilter
 
-__all__ = ["Filter", "GitFilter", "NoopFilter"]
+__all__ = [
+    "And",
+    "ChangedFilesCache",
+    "CompositeFilter",
+    "DiskChangedFilesCache",
+    "Filter",
+    "GitFilter",
+    "NoopFilter",
+    "Not",
+    "Or",
+    "TagFilter",
+]
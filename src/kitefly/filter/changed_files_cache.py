@@ -0,0 +1,80 @@
+import os
+from typing import List, Optional
+
+from .git_refs import find_git_dir
+
+
+class ChangedFilesCache:
+    """
+    Storage for lists of changed files, keyed by the SHAs of the base and head
+    commits they were computed from. The base class stores nothing.
+    """
+
+    def get(self, base_sha: str, head_sha: str) -> Optional[List[str]]:
+        return None
+
+    def put(self, base_sha: str, head_sha: str, files: List[str]) -> None:
+        pass
+
+
+class DiskChangedFilesCache(ChangedFilesCache):
+    """
+    Persist changed file lists as files in a directory, by default `kitefly/changed-files`
+    within the repository's git directory. At most max_entries lists are kept, evicting
+    the least recently used.
+
+    Note that entries are keyed by commits only, so uncommitted changes in the working
+    tree are not reflected once a commit pair has been cached.
+    """
+
+    def __init__(self, directory: str = "", max_entries: int = 64):
+        self._directory = directory
+        self.max_entries = max_entries
+
+    @property
+    def directory(self) -> str:
+        if not self._directory:
+            git_dir = find_git_dir()
+            if not git_dir:
+                raise ValueError("No directory provided and not inside a git repository")
+            self._directory = os.path.join(git_dir, "kitefly", "changed-files")
+        return self._directory
+
+    def get(self, base_sha: str, head_sha: str) -> Optional[List[str]]:
+        path = self._path(base_sha, head_sha)
+        try:
+            with open(path, "rb") as stream:
+                content = stream.read()
+        except FileNotFoundError:
+            return None
+        # Refresh the modification time, which orders entries for eviction, unless
+        # another process evicted the entry since it was read
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return [os.fsdecode(f) for f in content.split(b"\0") if f]
+
+    def put(self, base_sha: str, head_sha: str, files: List[str]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(base_sha, head_sha)
+        partial = f"{path}.{os.getpid()}.tmp"
+        with open(partial, "wb") as stream:
+            stream.write(b"".join(os.fsencode(f) + b"\0" for f in files))
+        os.replace(partial, path)
+        self._evict()
+
+    def _path(self, base_sha: str, head_sha: str) -> str:
+        return os.path.join(self.directory, f"{base_sha}-{head_sha}")
+
+    def _evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                entries.append((entry.stat().st_mtime, entry.path))
+        entries.sort()
+        for _, path in entries[: max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,88 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List
+
+from .filter import Filter, is_group, prepare_filter, reset_filter
+from ..model.step import Step
+
+
+class CompositeFilter(Filter, ABC):
+    """
+    Base class for filters combining other filters. Each step's verdict is memoized
+    until the next call to prepare(), and the combined filters are evaluated in order
+    of increasing cost. The cost of a combination is the sum of their costs.
+    """
+
+    def __init__(self, *filters: Filter):
+        self.filters: List[Filter] = []
+        for f in filters:
+            # Flatten nested combinations of the same kind, e.g. (a & b) & c
+            if type(f) is type(self) and not isinstance(f, Not):
+                self.filters += f.filters
+            else:
+                self.filters.append(f)
+        self._order()
+        self.verdicts: Dict[Step, bool] = {}
+
+    def _order(self) -> None:
+        self.filters.sort(key=lambda f: f.cost)
+        self.cost = sum(f.cost for f in self.filters)
+
+    def prepare(self, steps: Iterable[Step]) -> None:
+        steps = list(steps)
+        for f in self.filters:
+            prepare_filter(f, steps)
+        # Costs may depend on what was prepared (e.g. indexes being built)
+        self._order()
+        self.verdicts.clear()
+
+    def reset(self) -> None:
+        for f in self.filters:
+            reset_filter(f)
+        self.verdicts.clear()
+
+    def __call__(self, step: Step) -> bool:
+        verdict = self.verdicts.get(step)
+        if verdict is None:
+            verdict = self.verdicts[step] = bool(self.evaluate(step))
+        return verdict
+
+    @abstractmethod
+    def evaluate(self, step: Step) -> bool:
+        """
+        Return whether the combined filters include the step.
+        """
+
+
+class And(CompositeFilter):
+    """
+    Include steps included by every filter, skipping the remaining filters as soon
+    as one excludes the step.
+    """
+
+    def evaluate(self, step: Step) -> bool:
+        return all(f(step) for f in self.filters)
+
+
+class Or(CompositeFilter):
+    """
+    Include steps included by any filter, skipping the remaining filters as soon as
+    one includes the step.
+    """
+
+    def evaluate(self, step: Step) -> bool:
+        return any(f(step) for f in self.filters)
+
+
+class Not(CompositeFilter):
+    """
+    Include steps excluded by the filter. Groups are never included, as their steps
+    are filtered individually.
+    """
+
+    def __init__(self, filter: Filter):
+        super().__init__(filter)
+
+    def evaluate(self, step: Step) -> bool:
+        if is_group(step):
+            return False
+        return not self.filters[0](step)
@@ -1,6 +1,72 @@
 from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Callable, Iterable
+
 from kitefly.model.step import Step
 
+if TYPE_CHECKING:
+    from .composite import And, Not, Or
+
+
+def prepare_filter(filter: Callable[[Step], bool], steps: Iterable[Step]) -> None:
+    """
+    Call filter.prepare(steps) if the filter defines it, so that plain callables can
+    also be used as filters.
+    """
+    prepare = getattr(filter, "prepare", None)
+    if prepare is not None:
+        prepare(steps)
+
+
+def reset_filter(filter: Callable[[Step], bool]) -> None:
+    """
+    Call filter.reset() if the filter defines it.
+    """
+    reset = getattr(filter, "reset", None)
+    if reset is not None:
+        reset()
+
+
+def is_group(step: Step) -> bool:
+    """
+    Return True if the step is a Group, whose steps are filtered individually.
+    """
+    # Imported here, as the model imports filters
+    from kitefly.model.group import Group
+
+    return isinstance(step, Group)
+
+
 class Filter():
+    # Relative cost of evaluating the filter for a single step, used to evaluate
+    # cheaper filters first when filters are combined
+    cost: float = 1.0
+
+    def prepare(self, steps: Iterable[Step]) -> None:
+        """
+        Called with every step (including the contents of groups) before the
+        filter is applied, so that implementations can build indexes up-front.
+        """
+
+    def reset(self) -> None:
+        """
+        Called by Pipeline.filtered before prepare(), so that implementations can
+        forget what they learned while filtering another pipeline.
+        """
+
     def __call__(self, step: Step) -> bool:
         return False
+
+    def __and__(self, other: "Filter") -> "And":
+        from .composite import And
+
+        return And(self, other)
+
+    def __or__(self, other: "Filter") -> "Or":
+        from .composite import Or
+
+        return Or(self, other)
+
+    def __invert__(self) -> "Not":
+        from .composite import Not
+
+        return Not(self)
@@ -1,41 +1,351 @@
-import functools
 import os
-import re
-from subprocess import check_output, check_call
-from typing import Dict, List
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from subprocess import (
+    DEVNULL,
+    PIPE,
+    CalledProcessError,
+    Popen,
+    TimeoutExpired,
+    check_call,
+    check_output,
+)
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
 
+from .changed_files_cache import ChangedFilesCache
 from .filter import Filter
+from .git_refs import find_git_dir, resolve_ref
+from .. import trace
 from ..model.step import Step
 from ..model.target import Target
+from ..model.target_set import TargetMatches, TargetSet
+
+
+FETCH_MODES = ("always", "if-missing", "never")
 
 
 class GitFilter(Filter):
-    def __init__(self, base_branch: str = "") -> None:
+    """
+    Filter which includes steps whose Targets match files changed relative to the
+    base branch (by default, BUILDKITE_PULL_REQUEST_BASE_BRANCH).
+
+    Each changed file is assigned to the single Target with the highest priority (or
+    longest pattern) that matches it, and steps are included if one of their Targets,
+    or a dependency of one of their Targets, owns a file. With exclusive=False, steps
+    are instead included when any of their Targets match any changed file.
+
+    Acquiring the list of changed files can be tuned with:
+    - prefetch: start fetching and diffing in a background thread immediately, so
+      that it overlaps with the construction of the pipeline
+    - fetch: "always" fetch the base branch, fetch only "if-missing" (when no merge
+      base with HEAD exists locally), or "never" fetch
+    - fetch_depth / fetch_filter: passed to `git fetch` as --depth and --filter (e.g.
+      "blob:none") so shallow or partial CI clones avoid downloading full history
+    - timeout: seconds allowed for each git command
+    - cwd: the directory within the repository to run git in (default: the current
+      directory)
+    - cache: a ChangedFilesCache (e.g. DiskChangedFilesCache) which stores the
+      changed files for each pair of base and head commits, so that regenerating
+      the pipeline for the same commits runs no git commands at all. The cache is
+      consulted with the base branch as it is locally, before fetching, so a hit
+      skips the fetch even with fetch="always"
+
+    The verdict for each distinct Target is computed once per diff and stored in
+    match_cache, which is shared by the Group.filtered calls using this filter and
+    reset by each Pipeline.filtered call, so that one filter can filter several
+    pipelines; cache_hits and cache_misses count lookups for tuning.
+    """
+
+    # Verdicts are cached per Target, but each step's Targets must still be resolved
+    cost = 10.0
+
+    def __init__(
+        self,
+        base_branch: str = "",
+        *,
+        prefetch: bool = False,
+        fetch: str = "always",
+        fetch_depth: int = 0,
+        fetch_filter: str = "",
+        timeout: Optional[float] = None,
+        cache: Optional[ChangedFilesCache] = None,
+        exclusive: bool = True,
+        cwd: str = "",
+    ) -> None:
+        if fetch not in FETCH_MODES:
+            raise ValueError(f"fetch must be one of {FETCH_MODES}, got {fetch!r}")
         self.base_branch = base_branch or os.environ.get(
             "BUILDKITE_PULL_REQUEST_BASE_BRANCH", ""
         )
+        self.fetch = fetch
+        self.fetch_depth = fetch_depth
+        self.fetch_filter = fetch_filter
+        self.timeout = timeout
+        self.cache = cache
+        self.exclusive = exclusive
+        self.cwd = cwd
         self.match_cache: Dict[Target, bool] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._match_cache_branch = self.base_branch
+        self.target_set = TargetSet()
+        self._matches: Optional[TargetMatches] = None
+        self._pending: Optional["Future[List[str]]"] = None
+        self._changed_files: Dict[str, List[str]] = {}
         super().__init__()
+        if prefetch:
+            self.start()
+
+    def start(self) -> None:
+        """
+        Begin acquiring the changed files in a background thread. The result is
+        awaited the first time a step is filtered.
+        """
+        if self._pending is not None or not self.base_branch:
+            return
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kitefly-git")
+        self._pending = executor.submit(self._acquire, self.base_branch)
+        executor.shutdown(wait=False)
+
+    def prepare(self, steps: Iterable[Step]) -> None:
+        """
+        Index the targets of every step, and classify the changed files against all
+        of them in a single pass. Classifying here, rather than when the first step
+        is filtered, means steps can then be filtered by worker processes (see
+        Pipeline.filtered) without each repeating the classification.
+        """
+        self.prepare_targets(t for step in steps for t in step.get_targets())
+        if self.base_branch:
+            self._classify()
+
+    def reset(self) -> None:
+        """
+        Forget the indexed Targets and their verdicts, keeping the changed files.
+        """
+        self.match_cache.clear()
+        self.target_set = TargetSet()
+        self._matches = None
 
     def __call__(self, step: Step) -> bool:
         if not self.base_branch:
             return True
-        for filepath in self._files_changed_since_branch(self.base_branch):
-            for target in step.get_targets():
-                if target.matches(filepath):
-                    return True
-        return False
+        return any(self.target_matches(target) for target in step.get_targets())
+
+    def target_matches(self, target: Target) -> bool:
+        """
+        Return True if the Target selects steps for the changed files, using the
+        verdict cached for the current diff when available.
+        """
+        if self._match_cache_branch != self.base_branch:
+            self.match_cache.clear()
+            self._matches = None
+            self._match_cache_branch = self.base_branch
+        verdict = self.match_cache.get(target)
+        if verdict is not None:
+            self.cache_hits += 1
+            return verdict
+        self.cache_misses += 1
+        if target not in self.target_set:
+            self.prepare_targets([target])
+        matches = self.matches
+        verdict = target in (matches.owned if self.exclusive else matches.matched)
+        self.match_cache[target] = verdict
+        return verdict
+
+    def prepare_targets(self, targets: Iterable[Target]) -> None:
+        """
+        Index the provided Targets, along with their dependencies.
+
+        In exclusive mode, file ownership depends on every indexed Target, so new
+        Targets could change the verdicts already given for others. Raises ValueError
+        if they would, as steps would then be filtered inconsistently; prepare the
+        filter with every step up-front (as Pipeline.filtered does) to avoid this.
+        """
+        if not (self.exclusive and self.match_cache):
+            size = len(self.target_set)
+            self.target_set.add(targets)
+            if len(self.target_set) != size:
+                self._matches = None
+            return
+        candidate = TargetSet(self.target_set)
+        candidate.add(targets)
+        if len(candidate) == len(self.target_set):
+            return
+        matches = candidate.classify(self._files_changed_since_branch(self.base_branch))
+        changed = [t for t, verdict in self.match_cache.items() if (t in matches.owned) != verdict]
+        if changed:
+            names = ", ".join(sorted(t.name or str(t) for t in changed))
+            raise ValueError(
+                f"New Targets change the verdicts already given for: {names}. "
+                "Prepare the filter with every step before filtering."
+            )
+        self.target_set = candidate
+        self._matches = matches
+
+    @property
+    def cache_stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "targets": len(self.match_cache),
+        }
+
+    def changed_files(self) -> List[str]:
+        """
+        Return the files changed relative to the base branch.
+        """
+        return list(self._files_changed_since_branch(self.base_branch))
+
+    def explain(self) -> str:
+        """
+        Return a report of which Target (and pattern) each changed file selected.
+        """
+        lines = []
+        for path, target, pattern in self.matches.explain():
+            lines.append(f"{path} -> {target.name or target} [{pattern}]")
+        return "\n".join(lines)
+
+    @property
+    def matches(self) -> TargetMatches:
+        """
+        Return the classification of the changed files against every indexed Target.
+        """
+        return self._classify()
+
+    def _classify(self) -> TargetMatches:
+        if self._matches is None:
+            files = self._files_changed_since_branch(self.base_branch)
+            with trace.span("filter.classify", len(files)):
+                self._matches = self.target_set.classify(files)
+        return self._matches
 
-    @functools.lru_cache()
     def _files_changed_since_branch(self, branch: str) -> List[str]:
-        check_call(["git", "fetch", "origin", branch])
-        git_root = check_output(
-            ["git", "rev-parse", "--show-toplevel"], universal_newlines=True
-        ).split(os.linesep)[0]
-        lines = check_output(
-            ["git", "diff", "--name-only", branch],
+        if branch not in self._changed_files:
+            if self._pending is not None and branch == self.base_branch:
+                self._changed_files[branch] = self._pending.result()
+            else:
+                self._changed_files[branch] = self._acquire(branch)
+        return self._changed_files[branch]
+
+    def _acquire(self, branch: str) -> List[str]:
+        commits = self._commits(branch) if self.cache else None
+        if self.cache and commits:
+            cached = self.cache.get(*commits)
+            if cached is not None:
+                return cached
+
+        # Resolve the repository root while the fetch is in progress
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            git_root = executor.submit(self._git_root)
+            self._fetch(branch)
+            cwd = git_root.result()
+
+        if self.cache:
+            # Fetching may have created or moved the base branch, so the files must be
+            # stored (and may already be cached) under the commits as they are now
+            fetched = self._commits(branch)
+            if fetched and fetched != commits:
+                cached = self.cache.get(*fetched)
+                if cached is not None:
+                    return cached
+            commits = fetched
+
+        files = list(
+            _read_nul_separated(
+                ["git", "diff", "-z", "--name-only", branch], cwd, self.timeout
+            )
+        )
+        if self.cache and commits:
+            self.cache.put(*commits, files)
+        return files
+
+    def _commits(self, branch: str) -> Optional[Tuple[str, str]]:
+        """
+        Return the SHAs of the base branch and HEAD, read directly from the git
+        directory, or None if either cannot be resolved without running git.
+        """
+        git_dir = find_git_dir(self.cwd)
+        if not git_dir:
+            return None
+        base = resolve_ref(git_dir, branch)
+        head = resolve_ref(git_dir, "HEAD")
+        if base and head:
+            return base, head
+        return None
+
+    def _git_root(self) -> str:
+        return check_output(
+            ["git", "rev-parse", "--show-toplevel"],
             universal_newlines=True,
-            cwd=git_root,
-        ).split(os.linesep)
-        re_word_char = re.compile(r"\w")
-        return [n.strip() for n in lines if re_word_char.match(n)]
+            timeout=self.timeout,
+            cwd=self.cwd or None,
+        ).split(os.linesep)[0]
+
+    def _fetch(self, branch: str) -> None:
+        if self.fetch == "never":
+            return
+        if self.fetch == "if-missing" and self._has_merge_base(branch):
+            return
+        cmd = ["git", "fetch"]
+        if self.fetch_depth:
+            cmd.append(f"--depth={self.fetch_depth}")
+        if self.fetch_filter:
+            cmd.append(f"--filter={self.fetch_filter}")
+        check_call(cmd + ["origin", branch], timeout=self.timeout, cwd=self.cwd or None)
+
+    def _has_merge_base(self, branch: str) -> bool:
+        try:
+            check_output(
+                ["git", "merge-base", "HEAD", branch],
+                stderr=DEVNULL,
+                timeout=self.timeout,
+                cwd=self.cwd or None,
+            )
+        except CalledProcessError:
+            return False
+        return True
+
+
+def _read_nul_separated(
+    cmd: List[str], cwd: str, timeout: Optional[float]
+) -> Iterator[str]:
+    """
+    Run a command and yield each NUL-terminated record of its output as it is read,
+    raising TimeoutExpired if the command runs longer than timeout seconds.
+    """
+    proc = Popen(cmd, cwd=cwd, stdout=PIPE)
+    timed_out = threading.Event()
+
+    def kill() -> None:
+        timed_out.set()
+        proc.kill()
+
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer:
+        timer.start()
+    try:
+        yield from _split_records(proc.stdout)
+    finally:
+        if timer:
+            timer.cancel()
+        returncode = proc.wait()
+    if timed_out.is_set():
+        raise TimeoutExpired(cmd, timeout or 0)
+    if returncode:
+        raise CalledProcessError(returncode, cmd)
+
+
+def _split_records(stream: Optional[IO[bytes]], chunk_size: int = 65536) -> Iterator[str]:
+    if stream is None:
+        return
+    remainder = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        *records, remainder = (remainder + chunk).split(b"\0")
+        for record in records:
+            if record:
+                yield os.fsdecode(record)
+    if remainder:
+        yield os.fsdecode(remainder)
@@ -0,0 +1,101 @@
+import os
+from typing import Optional
+
+SHA_LENGTHS = (40, 64)
+
+
+def find_git_dir(start: str = "") -> Optional[str]:
+    """
+    Return the git directory for the repository containing `start` (default: the
+    current directory), following `.git` files used by worktrees and submodules.
+    """
+    path = os.path.abspath(start or os.getcwd())
+    while True:
+        candidate = os.path.join(path, ".git")
+        if os.path.isdir(candidate):
+            return candidate
+        if os.path.isfile(candidate):
+            with open(candidate, encoding="utf8") as stream:
+                content = stream.read().strip()
+            if content.startswith("gitdir:"):
+                git_dir = content[len("gitdir:"):].strip()
+                return os.path.normpath(os.path.join(path, git_dir))
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def resolve_ref(git_dir: str, name: str) -> Optional[str]:
+    """
+    Resolve a ref name (e.g. "HEAD", "main" or "origin/main") to a commit SHA by
+    reading the git directory directly, following the same lookup order as
+    `git rev-parse`. Annotated tags resolve to the SHA of the tag object. Returns
+    None if the ref cannot be resolved this way, such as for revision expressions.
+    """
+    if _is_sha(name):
+        return name
+    common_dir = _common_dir(git_dir)
+    if name == "HEAD" or name.startswith("refs/"):
+        candidates = [name]
+    else:
+        candidates = [
+            name,
+            f"refs/{name}",
+            f"refs/tags/{name}",
+            f"refs/heads/{name}",
+            f"refs/remotes/{name}",
+        ]
+    for ref in candidates:
+        sha = _read_ref(git_dir, common_dir, ref, depth=0)
+        if sha:
+            return sha
+    return None
+
+
+def _read_ref(git_dir: str, common_dir: str, ref: str, depth: int) -> Optional[str]:
+    if depth > 5:
+        return None
+    # Per-worktree refs (HEAD) live in the git dir, shared refs in the common dir
+    for base in (git_dir, common_dir):
+        path = os.path.join(base, *ref.split("/"))
+        if os.path.isfile(path):
+            with open(path, encoding="utf8") as stream:
+                content = stream.read().strip()
+            if content.startswith("ref:"):
+                target = content[len("ref:"):].strip()
+                return _read_ref(git_dir, common_dir, target, depth + 1)
+            return content if _is_sha(content) else None
+    return _read_packed_ref(common_dir, ref)
+
+
+def _read_packed_ref(common_dir: str, ref: str) -> Optional[str]:
+    path = os.path.join(common_dir, "packed-refs")
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding="utf8") as stream:
+        for line in stream:
+            if line.startswith(("#", "^")):
+                continue
+            parts = line.split()
+            if len(parts) == 2 and parts[1] == ref and _is_sha(parts[0]):
+                return parts[0]
+    return None
+
+
+def _common_dir(git_dir: str) -> str:
+    path = os.path.join(git_dir, "commondir")
+    if os.path.isfile(path):
+        with open(path, encoding="utf8") as stream:
+            return os.path.normpath(os.path.join(git_dir, stream.read().strip()))
+    return git_dir
+
+
+def _is_sha(value: str) -> bool:
+    if len(value) not in SHA_LENGTHS:
+        return False
+    try:
+        int(value, 16)
+    except ValueError:
+        return False
+    return True
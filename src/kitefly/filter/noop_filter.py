@@ -2,5 +2,7 @@ from .filter import Filter
 from ..model.step import Step
 
 class NoopFilter(Filter):
+    cost = 0.0
+
     def __call__(self, step: Step) -> bool:
         return True
\ No newline at end of file
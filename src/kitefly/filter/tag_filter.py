@@ -0,0 +1,168 @@
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from .filter import Filter, is_group
+from ..model.step import Step
+
+RE_TOKEN = re.compile(r"\s*(?:([&|!()])|([^\s&|!()]+))")
+
+# A parsed expression: a tag name, or an operator and its operands
+Expression = Union[str, Tuple[str, List["Expression"]]]
+
+
+class TagFilter(Filter):
+    """
+    Filter which includes steps whose tags (see Step.get_tags) satisfy an expression
+    of tag names combined with `&` (and), `|` (or), `!` (not) and parentheses, e.g.
+    `smoke & !slow` or `(unit | integration) & !flaky`.
+
+    prepare() builds an inverted index from each tag to the steps carrying it, and the
+    expression is then evaluated once with set operations over the index, rather than
+    once per step. Steps which were not prepared are checked individually. Groups
+    carry no tags of their own and are never included, even by negated expressions,
+    as their steps are filtered individually.
+    """
+
+    cost = 0.5
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.parsed = _Parser(expression).parse()
+        self.index: Dict[str, Set[int]] = {}
+        self._steps: Dict[int, Step] = {}
+        self._selected: Optional[Set[int]] = None
+
+    def prepare(self, steps: Iterable[Step]) -> None:
+        """
+        Add the tags of steps which aren't indexed yet to the index.
+        """
+        for step in steps:
+            if id(step) in self._steps or is_group(step):
+                continue
+            self._steps[id(step)] = step
+            self._selected = None
+            for tag in step.get_tags():
+                self.index.setdefault(tag, set()).add(id(step))
+
+    def __call__(self, step: Step) -> bool:
+        if self._steps.get(id(step)) is step:
+            return id(step) in self.selected
+        if is_group(step):
+            return False
+        return self.matches(step.get_tags())
+
+    @property
+    def selected(self) -> Set[int]:
+        """
+        Return the ids of the indexed steps satisfying the expression.
+        """
+        if self._selected is None:
+            self._selected = self._select(self.parsed)
+        return self._selected
+
+    def select(self) -> List[Step]:
+        """
+        Return the indexed steps satisfying the expression, in the order they were
+        prepared.
+        """
+        selected = self.selected
+        return [step for key, step in self._steps.items() if key in selected]
+
+    def matches(self, tags: Iterable[str]) -> bool:
+        """
+        Return True if the tags satisfy the expression.
+        """
+        return _evaluate(self.parsed, set(tags))
+
+    def _select(self, expression: Expression) -> Set[int]:
+        if isinstance(expression, str):
+            # A copy, so that callers can't modify the index
+            return set(self.index.get(expression, ()))
+        op, operands = expression
+        if op == "!":
+            return set(self._steps).difference(self._select(operands[0]))
+        sets = [self._select(operand) for operand in operands]
+        if op == "&":
+            return set.intersection(*sets)
+        return set.union(*sets)
+
+    def __repr__(self) -> str:
+        return f"TagFilter({self.expression!r})"
+
+
+def _evaluate(expression: Expression, tags: Set[str]) -> bool:
+    if isinstance(expression, str):
+        return expression in tags
+    op, operands = expression
+    if op == "!":
+        return not _evaluate(operands[0], tags)
+    if op == "&":
+        return all(_evaluate(operand, tags) for operand in operands)
+    return any(_evaluate(operand, tags) for operand in operands)
+
+
+class _Parser:
+    """
+    Recursive descent parser for tag expressions, where `!` binds tighter than `&`,
+    which binds tighter than `|`.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.tokens: List[Tuple[str, int]] = []
+        position = 0
+        text = expression.rstrip()
+        while position < len(text):
+            match = RE_TOKEN.match(text, position)
+            if not match:
+                raise self.error("unexpected character", position)
+            group = 1 if match.group(1) else 2
+            self.tokens.append((match.group(group), match.start(group)))
+            position = match.end()
+        self.position = 0
+
+    def parse(self) -> Expression:
+        if not self.tokens:
+            raise ValueError("Empty tag expression")
+        expression = self._or()
+        if self.position < len(self.tokens):
+            raise self.error("unexpected token", self.tokens[self.position][1])
+        return expression
+
+    def error(self, message: str, offset: int) -> ValueError:
+        return ValueError(f"Invalid tag expression {self.expression!r}: {message} at {offset}")
+
+    def _peek(self) -> Optional[str]:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][0]
+        return None
+
+    def _binary(self, op: str, operand: Callable[[], Expression]) -> Expression:
+        operands = [operand()]
+        while self._peek() == op:
+            self.position += 1
+            operands.append(operand())
+        return operands[0] if len(operands) == 1 else (op, operands)
+
+    def _or(self) -> Expression:
+        return self._binary("|", self._and)
+
+    def _and(self) -> Expression:
+        return self._binary("&", self._not)
+
+    def _not(self) -> Expression:
+        token = self._peek()
+        if token is None:
+            raise self.error("unexpected end", len(self.expression))
+        self.position += 1
+        if token == "!":
+            return ("!", [self._not()])
+        if token == "(":
+            expression = self._or()
+            if self._peek() != ")":
+                raise self.error("missing ')'", len(self.expression))
+            self.position += 1
+            return expression
+        if token in ("&", "|", ")"):
+            raise self.error(f"unexpected {token!r}", self.tokens[self.position - 1][1])
+        return token
@@ -3,9 +3,12 @@ from .step import Step
 from .command import Command
 from .group import Group
 from .input import Option, Input, Block, TextField, SelectField
+from .matrix import Matrix
 from .pipeline import Pipeline
 from .plugin import Plugin
-from .target import Target
+from .step_graph import StepGraph
+from .target import Target, TargetCycleError, TargetGraph
+from .target_set import TargetMatches, TargetSet
 from .trigger import BuildAttributes, Trigger
 from .retry import AutomaticRetry
 from .wait import Wait
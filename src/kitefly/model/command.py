@@ -1,11 +1,40 @@
-from typing import Any, Dict, List, Optional, Union
+import sys
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 from .plugin import Plugin
-from .step import Step
+from .step import Step, class_attribute
 from .retry import AutomaticRetry, ManualRetry
 
 from ..util import generate_key
 
+if TYPE_CHECKING:
+    from .matrix import Matrix
+
+
+class InheritedProperties(NamedTuple):
+    """
+    Properties of a Command class aggregated from its class hierarchy.
+    """
+
+    env: Dict[str, str]
+    agents: Dict[str, str]
+    artifact_paths: FrozenSet[str]
+    plugins: Tuple[Plugin, ...]
+    timeout_in_minutes: int
+
 
 class Command(Step):
     """
@@ -15,6 +44,23 @@ class Command(Step):
     See: https://buildkite.com/docs/pipelines/command-step
     """
 
+    __slots__ = (
+        "label",
+        "command",
+        "env",
+        "agents",
+        "automatic_retries",
+        "soft_fail",
+        "manual_retry",
+        "concurrency",
+        "concurrency_group",
+        "plugins",
+        "artifact_paths",
+        "skip_reason",
+        "parallelism",
+        "timeout_in_minutes",
+    )
+
     def __init__(
         self,
         label: str,
@@ -39,7 +85,10 @@ class Command(Step):
         **kwargs
     ):
         super().__init__(tags=tags, **kwargs)
-        self.key = key or generate_key(label)
+        # Keys are repeated in the depends_on lists of other steps, so share one copy
+        self.key = sys.intern(
+            key or generate_key(label, self.__class__.__qualname__, command)
+        )
         self.label = label
         self.command = command
         self.env = env or {}
@@ -72,23 +121,19 @@ class Command(Step):
         d["label"] = self.label
         d["key"] = self.key
 
-        # Setup inheritable properties using class-based defaults using MRO
-        # to aggregate hash and list types, or determine the first valid value
-        # for scalar types like timeout_in_minutes
-        env: dict[str, str] = {}
-        agents: dict[str, str] = {}
-        artifact_paths = set(self.artifact_paths or [])
-        plugins = set(self.plugins or [])
-        timeout_in_minutes = self.timeout_in_minutes
-        for cls in self.classes():
-            env.update(getattr(cls, "env", {}))
-            agents.update(getattr(cls, "agents", {}))
-            artifact_paths |= set(getattr(cls, "artifact_paths", []))
-            plugins |= set(getattr(cls, "plugins", []))
-            if not timeout_in_minutes:
-                timeout_in_minutes = getattr(cls, "timeout_in_minutes", 0)
+        # Inheritable properties are resolved once per class (see _inherited), and
+        # merged here with the values set on this step
+        inherited = self._inherited()
+        env = dict(inherited.env)
         env.update(self.env)
+        agents = dict(inherited.agents)
         agents.update(self.agents)
+        artifact_paths = inherited.artifact_paths.union(self.artifact_paths or [])
+        plugins = list(inherited.plugins)
+        for plugin in self.plugins or []:
+            if plugin not in plugins:
+                plugins.append(plugin)
+        timeout_in_minutes = self.timeout_in_minutes or inherited.timeout_in_minutes
 
         if env:
             d["env"] = env
@@ -100,7 +145,7 @@ class Command(Step):
             d["timeout_in_minutes"] = timeout_in_minutes
         if plugins:
             d["plugins"] = {}
-            for plugin in list(plugins):
+            for plugin in plugins:
                 d["plugins"][plugin.name] = plugin.args
         if self.priority is not None:
             d["priority"] = self.priority
@@ -129,8 +174,59 @@ class Command(Step):
 
         return d
 
-    def __hash__(self) -> int:
-        return hash(self.key)
+    @classmethod
+    def matrix(
+        cls,
+        label: str,
+        command: str,
+        axes: Mapping[str, Iterable[Any]],
+        *,
+        group: str = "",
+        key: str = "",
+        **kwargs
+    ) -> "Matrix":
+        """
+        Return a Matrix of this Command class, with one step per combination of axis
+        values. The label and command may reference axis values as `{{matrix.<axis>}}`.
+        The group label defaults to the label with these references removed.
+        """
+        from .matrix import RE_MATRIX_VAR, Matrix
+
+        group = group or " ".join(RE_MATRIX_VAR.sub("", label).split())
+        key = key or generate_key(group or label, f"{cls.__qualname__}.matrix", command)
+        template = cls(label, command, key=key, **kwargs)
+        return Matrix(template, axes, label=group)
+
+    @classmethod
+    def _inherited(cls) -> "InheritedProperties":
+        """
+        Aggregate class-based defaults along the reverse MRO: hash and list types are
+        merged, and scalar types like timeout_in_minutes take the first valid value.
+        The result is computed once per class.
+        """
+        cache = cls._class_defaults()
+        if "inherited" not in cache:
+            env: Dict[str, str] = {}
+            agents: Dict[str, str] = {}
+            artifact_paths: Set[str] = set()
+            plugins: List[Plugin] = []
+            timeout_in_minutes = 0
+            classes = [c for c in cls.__mro__ if c is not object]
+            # Only attributes defined on each class are read, so the slot descriptors
+            # of Command itself are skipped
+            for c in reversed(classes):
+                env.update(class_attribute(c, "env") or {})
+                agents.update(class_attribute(c, "agents") or {})
+                artifact_paths |= set(class_attribute(c, "artifact_paths") or [])
+                for plugin in class_attribute(c, "plugins") or []:
+                    if plugin not in plugins:
+                        plugins.append(plugin)
+                if not timeout_in_minutes:
+                    timeout_in_minutes = class_attribute(c, "timeout_in_minutes", 0)
+            cache["inherited"] = InheritedProperties(
+                env, agents, frozenset(artifact_paths), tuple(plugins), timeout_in_minutes
+            )
+        return cache["inherited"]
 
     def __str__(self) -> str:
         return f"Command(key={self.key}, label={self.label})"
\ No newline at end of file
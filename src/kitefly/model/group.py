@@ -1,25 +1,39 @@
-from typing import Iterable, List, Tuple, Union
-from kitefly.filter.filter import Filter
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+from kitefly.filter.filter import prepare_filter
 
 from kitefly.util import generate_key
 
+from .matrix import Matrix
 from .step import Step
 
 class Group(Step):
   """
   Entity used to group multiple steps together, useful mostly for adding dependency relationships en-masse
   """
+  # Incremented whenever the steps of any group change, which invalidates the
+  # flattened steps cached by groups containing it
+  _version = 0
+
   def __init__(self, steps: Iterable[Step], *, key: str = "", label: str = "", **kwargs):
     super().__init__(**kwargs)
     self._steps: list[Step] = list(steps)
+    for step in self._steps:
+      _check_nested(step)
     self.label = label
-    self.key = generate_key(label or 'Group')
+    self.key = generate_key(label or 'Group', 'Group')
+    # (Group._version, id(self._steps), flattened steps)
+    self._flattened: Optional[Tuple[int, int, Tuple[Step, ...]]] = None
 
   def __iadd__(self, value: Step) -> 'Group':
+    _check_nested(value)
     if isinstance(value, Group):
-      self._steps += value.steps
+      self._steps += value.iter_steps()
     else:
       self._steps.append(value)
+    # The flattened steps are rebuilt when next read, so that adding steps one at a
+    # time doesn't copy them on each addition
+    Step._graph_version += 1
+    Group._version += 1
     return self
 
   def __add__(self, value: Step) -> 'Group':
@@ -37,7 +51,8 @@ class Group(Step):
       item << dep
     return self
 
-  def filtered(self, filter: Filter) -> 'Group':
+  def filtered(self, filter: Callable[[Step], bool]) -> 'Group':
+    prepare_filter(filter, self.iter_steps())
     fs = [s for s in self._steps if filter(s)]
     return Group(fs, label=self.label)
 
@@ -46,17 +61,49 @@ class Group(Step):
     """
     Return a flattened list of steps
     """
-    steps: list[Step] = []
-    for step in self._steps:
-      if isinstance(step, Group):
-        steps += step.steps
-      else:
-        steps.append(step)
-    return steps
+    return list(self._flattened_steps())
+
+  def iter_steps(self) -> Iterator[Step]:
+    """
+    Iterate over the flattened steps, without copying them into a new list.
+    """
+    return iter(self._flattened_steps())
+
+  @property
+  def size(self) -> int:
+    """
+    Return the number of flattened steps.
+    """
+    return len(self._flattened_steps())
+
+  def _cached_steps(self) -> Optional[Tuple[Step, ...]]:
+    cached = self._flattened
+    if cached is not None and cached[0] == Group._version and cached[1] == id(self._steps):
+      return cached[2]
+    return None
+
+  def _flattened_steps(self) -> Tuple[Step, ...]:
+    flattened = self._cached_steps()
+    if flattened is None:
+      steps: list[Step] = []
+      for step in self._steps:
+        if isinstance(step, Group):
+          steps.extend(step._flattened_steps())
+        else:
+          steps.append(step)
+      flattened = tuple(steps)
+      self._flattened = (Group._version, id(self._steps), flattened)
+    return flattened
 
   def asdict(self) -> dict:
     return {
       "group": self.label or "Group",
       "key": self.key,
-      "steps": [s.asdict() for s in self.steps]
+      "steps": [s.asdict() for s in self.iter_steps()]
     }
+
+
+def _check_nested(step: Step) -> None:
+  # Buildkite groups cannot be nested, and a Matrix is rendered as a group
+  if isinstance(step, Matrix):
+    raise ValueError("A Matrix cannot be added to a Group, add it to the Pipeline instead")
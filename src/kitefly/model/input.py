@@ -94,6 +94,8 @@ class Input(Step):
 
   See: https://buildkite.com/docs/pipelines/input-step
   """
+  __slots__ = ("prompt", "label", "blocked_state", "fields")
+
   def __init__(
     self,
     label: str,
@@ -126,6 +128,8 @@ class Block(Input):
 
   See: https://buildkite.com/docs/pipelines/block-step
   """
+  __slots__ = ()
+
   def asdict(self) -> dict:
     d = super().asdict()
     d["block"] = d["input"]
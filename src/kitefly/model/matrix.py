@@ -0,0 +1,135 @@
+import itertools
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Set, Tuple
+
+from .command import Command
+from .step import Step
+from .target import Target
+from ..util import normalize_key
+
+RE_MATRIX_VAR = re.compile(r"\{\{\s*matrix(?:\.([A-Za-z0-9_-]+))?\s*\}\}")
+
+
+class Matrix(Step):
+    """
+    A Command template expanded into one step per combination of axis values, which
+    is rendered as a Buildkite group keyed by the template's key.
+
+    Elements are only created while rendering, as plain dictionaries derived from a
+    single asdict() of the template, so class defaults are resolved once for the whole
+    matrix. `{{matrix.<axis>}}` (or `{{matrix}}` with a single axis) is substituted in
+    the label, command, env and plugin arguments of each element. Filters are applied
+    to the template's tags and targets, so a filtered out matrix is never expanded.
+
+    Example:
+
+        Command.matrix(
+            "Test {{matrix.os}} {{matrix.shard}}",
+            "script/test --shard {{matrix.shard}}",
+            axes={"os": ["linux", "macos"], "shard": range(8)},
+        )
+    """
+
+    __slots__ = ("template", "axes", "label")
+
+    def __init__(
+        self,
+        template: Command,
+        axes: Mapping[str, Iterable[Any]],
+        label: str = "",
+    ):
+        super().__init__()
+        self.template = template
+        self.axes: Dict[str, Tuple[Any, ...]] = {
+            name: tuple(values) for name, values in axes.items()
+        }
+        if not self.axes:
+            raise ValueError("Matrix requires at least one axis")
+        self.label = label or template.label
+        self.key = template.key
+        for text in (template.label, template.command):
+            for match in RE_MATRIX_VAR.finditer(text):
+                self._axis_name(match)
+
+    @property
+    def size(self) -> int:
+        """
+        Return the number of elements, without expanding the matrix.
+        """
+        size = 1
+        for values in self.axes.values():
+            size *= len(values)
+        return size
+
+    def get_targets(self) -> List[Target]:
+        return self.template.get_targets()
+
+    def get_tags(self) -> List[str]:
+        return self.template.get_tags()
+
+    def combinations(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the axis values of each element, in order.
+        """
+        names = list(self.axes)
+        for values in itertools.product(*self.axes.values()):
+            yield dict(zip(names, values))
+
+    def element_dicts(self) -> Iterator[dict]:
+        """
+        Yield the rendered step of each element. Element keys are derived from the
+        matrix key and axis values, e.g. `test__linux__3`.
+        """
+        template = self.template.asdict()
+        template.pop("depends_on", None)
+        labelled = RE_MATRIX_VAR.search(self.template.label) is not None
+        keys: Set[str] = set()
+        for index, values in enumerate(self.combinations()):
+            d = self._substitute(template, values)
+            key = "__".join(
+                [self.key] + [normalize_key(str(v)) for v in values.values()]
+            )
+            if key in keys:
+                key = f"{key}__{index}"
+            keys.add(key)
+            d["key"] = key
+            if not labelled:
+                d["label"] = f"{d['label']} ({', '.join(map(str, values.values()))})"
+            yield d
+
+    def asdict(self) -> dict:
+        d: Dict[str, Any] = {"group": self.label, "key": self.key}
+        if self.depends_on:
+            d["depends_on"] = self.depends_on
+        if self.allow_dependency_failure:
+            d["allow_dependency_failure"] = True
+        d["steps"] = list(self.element_dicts())
+        return d
+
+    def _substitute(self, value: Any, values: Dict[str, Any]) -> Any:
+        # Containers are always copied, so elements never share objects (which YAML
+        # would render as aliases)
+        if isinstance(value, str):
+            if "{{" not in value:
+                return value
+            return RE_MATRIX_VAR.sub(lambda m: str(values[self._axis_name(m)]), value)
+        if isinstance(value, dict):
+            return {k: self._substitute(v, values) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._substitute(v, values) for v in value]
+        return value
+
+    def _axis_name(self, match: "re.Match[str]") -> str:
+        name = match.group(1)
+        if name is None:
+            if len(self.axes) != 1:
+                raise ValueError(
+                    "{{matrix}} can only be used with a single axis, use {{matrix.<axis>}}"
+                )
+            return next(iter(self.axes))
+        if name not in self.axes:
+            raise ValueError(f"Unknown matrix axis: {name}")
+        return name
+
+    def __str__(self) -> str:
+        return f"Matrix(key={self.key}, label={self.label}, size={self.size})"
@@ -1,12 +1,18 @@
-from typing import Union, Iterable
+import copy
+import functools
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, TextIO, Tuple, Union
 
 from .command import Command
 from .group import Group
+from .matrix import Matrix
 from .step import Step
+from .step_graph import StepGraph
 from .target import Target
 from .wait import Wait
 
-from ..filter.filter import Filter
+from .. import parallel, render, trace, upload
+from ..render_cache import RenderCache, data_fingerprint
+from ..filter.filter import prepare_filter, reset_filter
 
 
 class Pipeline:
@@ -19,75 +25,294 @@ class Pipeline:
 
     def __init__(self, steps: Iterable[Step]):
         self.items: list[Step] = list(steps)
+        self._cache: Optional[Tuple[tuple, list[Step], StepGraph]] = None
 
-    def filtered(self, filter: Filter) -> "Pipeline":
+    def filtered(self, filter: Callable[[Step], bool], workers: int = 0) -> "Pipeline":
         """
         Filter the pipeline with the optional provided values and return a flattened
         list of steps with duplicate steps (via key) removed.
+
+        With workers > 1 (or -1 for one per CPU), steps are filtered in a pool of
+        worker processes after filter.prepare() has run in this process. State the
+        filter changes while filtering in a worker (such as its cached verdicts) is
+        dropped with the worker.
         """
+        with trace.span("filter", len(self.items)):
+            reset_filter(filter)
+            prepare_filter(filter, self._flattened_items())
+            if parallel.resolve_workers(workers) > 1:
+                return self._filtered_in_parallel(filter, workers)
+            filtered: list[Step] = []
+            for item in self.items:
+                if isinstance(item, Group):
+                    filtered.append(item.filtered(filter))
+                if isinstance(item, Step):
+                    if filter(item):
+                        filtered.append(item)
+        return Pipeline(filtered)
+
+    def _filtered_in_parallel(self, filter: Callable[[Step], bool], workers: int) -> "Pipeline":
+        chunks = parallel.map_partitions(
+            functools.partial(_filter_items, filter), self.items, workers, _weight
+        )
         filtered: list[Step] = []
-        for item in self.items:
+        verdicts = (verdict for chunk in chunks for verdict in chunk)
+        for item, (keep, children) in zip(self.items, verdicts):
             if isinstance(item, Group):
-                filtered.append(item.filtered(filter))
-            if isinstance(item, Step):
-                if filter(item):
-                    filtered.append(item)
+                steps = [s for s, k in zip(item._steps, children) if k]
+                filtered.append(Group(steps, label=item.label))
+            if keep:
+                filtered.append(item)
         return Pipeline(filtered)
 
+    def _flattened_items(self) -> list[Step]:
+        items: list[Step] = []
+        for item in self.items:
+            items.append(item)
+            if isinstance(item, Group):
+                items.extend(item.iter_steps())
+        return items
+
+    @property
+    def graph(self) -> StepGraph:
+        """
+        Return the dependency graph of all Command and Matrix steps in the pipeline, including
+        dependents that were not added to the pipeline directly.
+        """
+        return self._resolve()[1]
+
     @property
     def steps(self) -> list[Step]:
+        """
+        Return the top-level steps to render. The result is cached until the list of
+        items or any dependency edge or group membership changes. Steps whose
+        depends_on must be pruned are copied, so the original steps are never mutated.
+        """
+        return self._resolve()[0]
+
+    def _resolve(self) -> Tuple[list[Step], StepGraph]:
+        cache_key = (Step._graph_version, tuple(map(id, self.items)))
+        if self._cache is None or self._cache[0] != cache_key:
+            with trace.span("resolve", len(self.items)):
+                self._cache = (cache_key, *self._build_steps())
+        return self._cache[1], self._cache[2]
+
+    def _build_steps(self) -> Tuple[list[Step], StepGraph]:
         # (1) Dependent Inclusion
-        # Iterate through all steps and ensure all dependents are added to the list of steps,
+        # Walk all steps once and ensure all dependents are added to the list of steps,
         # even if they weren't in the list of steps added directly to the pipeline
-        steps = self.items
-        all_steps = steps[:]
-        for step in steps:
-            if isinstance(step, Group):
-                all_steps += step.steps
+        steps = list(self.items)
+        all_steps = self._flattened_items()
         seen = set(all_steps)
-        for step in all_steps:
-            for dep in step.dependents:
+        i = 0
+        while i < len(all_steps):
+            for dep in all_steps[i].dependents:
                 if dep not in seen:
                     seen.add(dep)
                     steps.append(dep)
                     all_steps.append(dep)
+                    if isinstance(dep, Group):
+                        for child in dep.iter_steps():
+                            if child not in seen:
+                                seen.add(child)
+                                all_steps.append(child)
+            i += 1
 
         # (2) Clean depends_on
-        # Remove any depends_on keys for steps that have been removed via filtering
-        keys = set([step.key for step in all_steps if isinstance(step, Command)])
+        # Drop any depends_on keys for steps that have been removed via filtering,
+        # or for empty matrices, which are not rendered, replacing affected steps
+        # with copies rather than modifying them in place
+        all_steps = [s for s in all_steps if not (isinstance(s, Matrix) and not s.size)]
+        graph = StepGraph(
+            step for step in all_steps if isinstance(step, (Command, Matrix))
+        )
+        replaced: Dict[int, Step] = {}
         for step in all_steps:
-            step.depends_on = [key for key in step.depends_on if key in keys]
+            depends_on = [key for key in step.depends_on if key in graph]
+            if len(depends_on) != len(step.depends_on):
+                clone = copy.copy(step)
+                clone.depends_on = depends_on
+                replaced[id(step)] = clone
+        if replaced:
+            steps = [_replace_steps(step, replaced) for step in steps]
 
-        # (3) Remove empty groups
-        cleaned: list[Step] = []
-        for step in steps:
-            if not isinstance(step, Group) or step.steps:
-                cleaned.append(step)
-        steps = cleaned
+        # (3) Remove empty groups and matrices
+        steps = [
+            s
+            for s in steps
+            if not (isinstance(s, Group) and not s.size)
+            and not (isinstance(s, Matrix) and not s.size)
+        ]
 
         # (4) Remove unnecessary Waits
         #     Remove runs of identical wait steps, and strip waits from the beginning/end
         #     of the pipeline
         last_step = None
-        cleaned = []
+        cleaned: list[Step] = []
         for step in steps:
             is_valid = True
             if isinstance(step, Wait):
-                is_valid = last_step is not None and last_step != step
+                is_valid = last_step is not None and not last_step.same_as(step)
             last_step = step
             if is_valid:
                 cleaned.append(step)
-        if isinstance(cleaned[-1], Wait):
+        if cleaned and isinstance(cleaned[-1], Wait):
             cleaned.pop()
-        steps = cleaned
 
-        return steps
+        return cleaned, graph
 
-    def asdict(self) -> dict:
-        d: dict = {"steps": [s.asdict() for s in self.steps]}
+    def asdict(self, workers: int = 0) -> dict:
+        """
+        Render the pipeline as plain data. With workers > 1 (or -1 for one per CPU),
+        top-level steps and groups are rendered in a pool of worker processes.
+        """
+        steps = self.steps
+        with trace.span("render.asdict", len(steps)):
+            if parallel.resolve_workers(workers) > 1:
+                chunks = parallel.map_partitions(_asdicts, steps, workers, _weight)
+                return {"steps": [d for chunk in chunks for d in chunk]}
+            d: dict = {"steps": [s.asdict() for s in steps]}
         return d
 
-    def asyaml(self) -> str:
-        import yaml
+    def asyaml(self, workers: int = 0, cache: Optional[RenderCache] = None) -> str:
+        """
+        Render the pipeline as YAML. With workers > 1 (or -1 for one per CPU), the
+        YAML of partitions of the top-level steps is rendered in a pool of worker
+        processes and joined in order; objects shared by steps in different
+        partitions are then written out in full rather than as YAML aliases.
+
+        With a RenderCache, the YAML of each top-level step is looked up by the
+        fingerprint of its asdict() data, and only steps missing from the cache are
+        serialized (and then stored). Objects shared between steps are then always
+        written out in full.
+        """
+        if cache is not None:
+            return self._asyaml_cached(workers, cache)
+        if parallel.resolve_workers(workers) > 1:
+            steps = self.steps
+            with trace.span("render.yaml", len(steps)):
+                fragments = parallel.map_partitions(_yaml_fragment, steps, workers, _weight)
+                return render.join_yaml_fragments(fragments)
+        d = self.asdict()
+        with trace.span("render.yaml", len(d["steps"])):
+            return render.dump_yaml(d)
+
+    def _asyaml_cached(self, workers: int, cache: RenderCache) -> str:
+        d = self.asdict()
+        with trace.span("render.fingerprint", len(d["steps"])):
+            fingerprints = [data_fingerprint(step) for step in d["steps"]]
+        # Empty until rendered, for steps missing from the cache
+        fragments: List[str] = [(fp and cache.get(fp)) or "" for fp in fingerprints]
+        missing = [i for i, fragment in enumerate(fragments) if not fragment]
+        with trace.span("render.yaml", len(missing)):
+            rendered = parallel.map_partitions(
+                _dump_yaml_fragments, [d["steps"][i] for i in missing], workers
+            )
+        for i, fragment in zip(missing, (f for chunk in rendered for f in chunk)):
+            fragments[i] = fragment
+            fingerprint = fingerprints[i]
+            if fingerprint:
+                cache.put(fingerprint, fragment)
+        cache.flush()
+        return render.join_yaml_fragments(fragments)
+
+    def asjson(self, indent: Optional[int] = None) -> str:
+        """
+        Render the pipeline as JSON, which is also accepted by `buildkite-agent pipeline upload`.
+        """
+        d = self.asdict()
+        with trace.span("render.json", len(d["steps"])):
+            return render.dump_json(d, indent=indent)
+
+    def chunks(self, max_steps: int = upload.MAX_STEPS, max_bytes: int = 0) -> List[str]:
+        """
+        Split the pipeline YAML into several documents of at most max_steps steps (and
+        max_bytes bytes, if given), to be uploaded one after another. Top-level steps
+        and groups are never split, every step is in the same or a later document than
+        the steps it depends on, and documents are preferably split before a Wait.
+        """
+        steps = self.steps
+        with trace.span("render.chunks", len(steps)):
+            fragments = [render.dump_yaml_fragment([s.asdict()]) for s in steps]
+            sizes = [len(fragment.encode("utf8")) for fragment in fragments]
+            ranges = upload.plan_chunks(steps, sizes, max_steps, max_bytes)
+            return [render.join_yaml_fragments(fragments[a:b]) for a, b in ranges]
+
+    def write_chunks(
+        self, directory: str, prefix: str = "pipeline", **limits: int
+    ) -> List[str]:
+        """
+        Write the chunks of the pipeline (see chunks()) to numbered files in the
+        directory, e.g. pipeline-001.yml, returning their paths.
+        """
+        return upload.write_chunks(self.chunks(**limits), directory, prefix)
+
+    def upload_chunks(
+        self, agent: str = "buildkite-agent", args: Sequence[str] = (), **limits: int
+    ) -> int:
+        """
+        Upload the chunks of the pipeline (see chunks()) in order, by passing each to
+        `buildkite-agent pipeline upload` on stdin. Returns the number of uploads.
+        """
+        chunks = self.chunks(**limits)
+        upload.upload_chunks(chunks, agent, args)
+        return len(chunks)
+
+    def write_yaml(self, stream: TextIO) -> None:
+        """
+        Stream the pipeline YAML to a file object, serializing one step at a time
+        rather than building the entire document in memory first.
+        """
+        steps = self.steps
+        with trace.span("render.stream", len(steps)):
+            render.write_yaml_steps((s.asdict() for s in steps), stream)
+
+
+def _replace_steps(step: Step, replaced: Dict[int, Step]) -> Step:
+    """
+    Return the replacement for a step, copying groups whose contents were replaced.
+    """
+    if id(step) in replaced:
+        step = replaced[id(step)]
+    if isinstance(step, Group):
+        children = [_replace_steps(child, replaced) for child in step._steps]
+        if any(a is not b for a, b in zip(children, step._steps)):
+            step = copy.copy(step)
+            step._steps = children
+    return step
+
+
+def _weight(step: Step) -> int:
+    if isinstance(step, Group):
+        return step.size + 1
+    if isinstance(step, Matrix):
+        return step.size
+    return 1
+
+
+def _filter_items(
+    filter: Callable[[Step], bool], items: Sequence[Step]
+) -> List[Tuple[bool, List[bool]]]:
+    """
+    Return whether each item is kept by the filter, and for groups whether each of
+    their steps is kept (an empty list for other items).
+    """
+    verdicts: List[Tuple[bool, List[bool]]] = []
+    for item in items:
+        children: List[bool] = []
+        if isinstance(item, Group):
+            children = [bool(filter(s)) for s in item._steps]
+        verdicts.append((bool(filter(item)), children))
+    return verdicts
+
+
+def _asdicts(steps: Sequence[Step]) -> List[dict]:
+    return [s.asdict() for s in steps]
+
+
+def _yaml_fragment(steps: Sequence[Step]) -> str:
+    return render.dump_yaml_fragment(_asdicts(steps))
+
 
-        return yaml.dump(self.asdict())
+def _dump_yaml_fragments(steps: Sequence[dict]) -> List[str]:
+    return [render.dump_yaml_fragment([d]) for d in steps]
@@ -4,6 +4,8 @@ class Plugin:
 
   See: https://buildkite.com/docs/plugins
   """
+  __slots__ = ("name", "args")
+
   def __init__(self, name: str, args: dict):
     self.name = name
     self.args = args
\ No newline at end of file
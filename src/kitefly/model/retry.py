@@ -8,6 +8,8 @@ class AutomaticRetry:
     will match all exit codes.
     """
 
+    __slots__ = ("limit", "exit_code")
+
     def __init__(self, limit: int, exit_code: str = "*"):
         self.limit = limit
         try:
@@ -25,6 +27,8 @@ class ManualRetry:
     Configuration entry for manual retry on a Command Step.
     """
 
+    __slots__ = ("allowed", "permit_on_passed", "reason")
+
     def __init__(
         self, allowed: bool = True, permit_on_passed: bool = False, reason: str = ""
     ):
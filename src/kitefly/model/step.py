@@ -1,16 +1,56 @@
-from typing import Any, Dict, List, Iterable, Optional, Union
+import hashlib
+import json
+import types
+from typing import Any, Dict, List, Iterable, Optional, Sequence, Tuple, Union
 
 from .target import Target
 from ..util import as_iterable, is_iterable
 
+# Shared, immutable default for private containers which are empty for most steps
+EMPTY_TUPLE: tuple = ()
+
+
+def class_attribute(cls: type, name: str, default: Any = None) -> Any:
+    """
+    Return an attribute defined directly on the class, ignoring the member
+    descriptors created by __slots__.
+    """
+    value = cls.__dict__.get(name, default)
+    if isinstance(value, types.MemberDescriptorType):
+        return default
+    return value
+
 
 class Step:
     """
     Generic root for pipeline steps containing common attributes such
     as 'if', 'branches', 'depends_on', and 'allow_dependency_failure'
+
+    Steps declare __slots__ so that large generated pipelines don't pay for a
+    per-instance __dict__. Subclasses which don't declare __slots__ themselves
+    still get a __dict__, so class-level defaults such as `env = {...}` on a
+    Command subclass keep working as before.
     """
 
+    __slots__ = (
+        "instance_serial",
+        "key",
+        "when",
+        "depends_on",
+        "dependents",
+        "branches",
+        "allow_dependency_failure",
+        "_tags",
+        "_targets",
+        "properties",
+        "priority",
+        "_fingerprint",
+    )
+
     _instance_count = 0
+    # Incremented whenever a dependency edge or group membership changes, which
+    # invalidates cached Pipeline results
+    _graph_version = 0
 
     def __init__(
         self,
@@ -30,10 +70,24 @@ class Step:
         self.dependents: List[Step] = []
         self.branches = branches
         self.allow_dependency_failure = allow_dependency_failure
-        self._tags = tags or []
-        self._targets = targets or []
+        self._tags = tags or EMPTY_TUPLE
+        self._targets = targets or EMPTY_TUPLE
         self.properties: dict = kwargs
         self.priority = priority
+        self._fingerprint: Optional[Tuple[Tuple[str, ...], str]] = None
+
+    @classmethod
+    def _class_defaults(cls) -> Dict[str, Any]:
+        """
+        Return a dictionary for caching values derived from class attributes. Each class
+        owns a separate cache, so values are resolved once per class rather than once
+        per instance.
+        """
+        cache = cls.__dict__.get("_class_defaults_cache")
+        if cache is None:
+            cache = {}
+            setattr(cls, "_class_defaults_cache", cache)
+        return cache
 
     def classes(self) -> List[type]:
         """
@@ -44,32 +98,48 @@ class Step:
         cmd: Cokmand
         cmd.classes() -> [Step, Command]
         """
-        classes = [cls for cls in self.__class__.__mro__ if cls is not object]
-        classes.reverse()
-        return classes
+        cache = self._class_defaults()
+        if "classes" not in cache:
+            classes = [cls for cls in self.__class__.__mro__ if cls is not object]
+            classes.reverse()
+            cache["classes"] = classes
+        return list(cache["classes"])
 
     def combined_parent_list(self, property: str) -> list:
-        values: list = []
-        print("CPL", property, self.classes())
-        for cls in self.classes():
-            cls_attr = cls.__dict__.get(property, [])
-            if is_iterable(cls_attr):
-                values += cls_attr
-        return values
+        return list(self._combined_parent_tuple(property))
+
+    def _combined_parent_tuple(self, property: str) -> tuple:
+        cache = self._class_defaults()
+        key = f"combined:{property}"
+        if key not in cache:
+            values: list = []
+            for cls in self.classes():
+                cls_attr = class_attribute(cls, property, [])
+                if is_iterable(cls_attr):
+                    values += cls_attr
+            cache[key] = tuple(values)
+        return cache[key]
+
+    def _distinct_sorted(self, own: Sequence[Any], property: str) -> list:
+        cache = self._class_defaults()
+        key = f"sorted:{property}"
+        if key not in cache:
+            cache[key] = sorted(set(self._combined_parent_tuple(property)))
+        if not own:
+            return list(cache[key])
+        return sorted(set(own).union(cache[key]))
 
     def get_targets(self) -> List[Target]:
         """
         Return distinct list of Targets associated with this step.
         """
-        return list(
-            sorted(list(set(self._targets + self.combined_parent_list("targets"))))
-        )
+        return self._distinct_sorted(self._targets, "targets")
 
     def get_tags(self) -> list[str]:
         """
         Return distinct list of tags associated with this step.
         """
-        return list(sorted(list(set(self._tags + self.combined_parent_list("tags")))))
+        return self._distinct_sorted(self._tags, "tags")
 
     def asdict(self) -> dict:
         """
@@ -104,6 +174,7 @@ class Step:
                 )
             dep.depends_on.append(self.key)
             self.dependents.append(dep)
+            Step._graph_version += 1
         return self
 
     def __rshift__(self, dep_on: Union["Step", Iterable["Step"]]) -> "Step":
@@ -116,12 +187,47 @@ class Step:
                 raise ValueError("Cannot depend on step: key is not defined")
             self.depends_on.append(parent.key)
             parent.dependents.append(self)
+            Step._graph_version += 1
         return self
 
+    def fingerprint(self) -> str:
+        """
+        Return a digest of the canonical serialized form of this step. The digest is
+        cached, and recomputed when depends_on changes; call invalidate_fingerprint()
+        after mutating other attributes of a step that has already been fingerprinted.
+        """
+        depends_on = tuple(self.depends_on)
+        if self._fingerprint is None or self._fingerprint[0] != depends_on:
+            canonical = json.dumps(self.asdict(), sort_keys=True, default=repr)
+            digest = hashlib.sha1(canonical.encode("utf8")).hexdigest()
+            self._fingerprint = (depends_on, digest)
+        return self._fingerprint[1]
+
+    def invalidate_fingerprint(self) -> None:
+        self._fingerprint = None
+
+    def same_as(self, step: Any) -> bool:
+        """
+        Structural equality: return True if both steps serialize identically.
+        """
+        if self is step:
+            return True
+        if isinstance(step, Step) and type(self) is type(step):
+            return self.fingerprint() == step.fingerprint()
+        return False
+
     def __eq__(self, step: Any) -> bool:
-        if isinstance(step, Step):
-            return self.asdict() == step.asdict()
+        """
+        Steps are equal if they are the same object, or are of the same class and
+        share a key. Use same_as() to compare the serialized content of steps.
+        """
+        if self is step:
+            return True
+        if isinstance(step, Step) and self.key and step.key:
+            return type(self) is type(step) and self.key == step.key
         return False
 
     def __hash__(self) -> int:
+        if self.key:
+            return hash(self.key)
         return self.instance_serial
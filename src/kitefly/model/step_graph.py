@@ -0,0 +1,62 @@
+from typing import Dict, Iterable, List
+
+from .step import Step
+
+
+class StepGraph:
+    """
+    Dependency graph of keyed steps, stored as adjacency lists keyed by step key.
+    Edges point from a step to the keys listed in its depends_on, and only edges
+    between steps present in the graph are kept.
+    """
+
+    def __init__(self, steps: Iterable[Step] = ()):
+        self.steps: Dict[str, Step] = {}
+        self.depends_on: Dict[str, List[str]] = {}
+        self.dependents: Dict[str, List[str]] = {}
+        for step in steps:
+            self.add(step)
+        for key, step in self.steps.items():
+            self._link(key, step.depends_on)
+
+    def add(self, step: Step) -> None:
+        if not step.key or step.key in self.steps:
+            return
+        self.steps[step.key] = step
+        self.depends_on[step.key] = []
+        self.dependents[step.key] = []
+
+    def _link(self, key: str, depends_on: Iterable[str]) -> None:
+        for dep in depends_on:
+            if dep in self.steps and dep not in self.depends_on[key]:
+                self.depends_on[key].append(dep)
+                self.dependents[dep].append(key)
+
+    def topological_order(self) -> List[str]:
+        """
+        Return all step keys ordered so that each step follows every step it depends
+        on, preserving insertion order where possible.
+
+        Raises ValueError if the graph contains a cycle.
+        """
+        remaining = {key: len(deps) for key, deps in self.depends_on.items()}
+        ready = [key for key, count in remaining.items() if not count]
+        ready.reverse()
+        order: List[str] = []
+        while ready:
+            key = ready.pop()
+            order.append(key)
+            for dependent in reversed(self.dependents[key]):
+                remaining[dependent] -= 1
+                if not remaining[dependent]:
+                    ready.append(dependent)
+        if len(order) != len(self.steps):
+            cycle = ", ".join(key for key in self.steps if remaining[key])
+            raise ValueError(f"Step dependency cycle between: {cycle}")
+        return order
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.steps
+
+    def __len__(self) -> int:
+        return len(self.steps)
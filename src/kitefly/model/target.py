@@ -1,17 +1,28 @@
-from typing import Generator, List, Set, Iterable, Union, Pattern
-from ..util import glob
+from typing import Container, Dict, Generator, List, Optional, Set, Iterable, Tuple, Union, Pattern
+from ..util import Glob, compile_glob
 
 
 class TargetPattern:
     GLOB_ALL = object()
 
     def __init__(self, pattern: Union[str, Pattern]):
+        # Glob strings are compiled (and shared) via compile_glob, and must match the
+        # full filepath. Regular expressions only need to match the start of it.
+        self.glob: Optional[Glob] = None
+        self.negated = False
         if isinstance(pattern, str):
-            self.pattern = glob(pattern)
+            self.glob = compile_glob(pattern)
+            self.pattern = self.glob.regex
+            self.negated = self.glob.negated
         else:
             self.pattern = pattern
 
     def matches(self, filepath: str) -> bool:
+        """
+        Return True if the filepath matches the pattern, disregarding negation.
+        """
+        if self.glob is not None:
+            return self.glob.matches(filepath)
         return self.pattern.match(filepath) is not None
 
     def __len__(self) -> int:
@@ -21,7 +32,8 @@ class TargetPattern:
         return len(self) < len(comp)
 
     def __str__(self) -> str:
-        return f"r/{self.pattern.pattern}/"
+        prefix = "!" if self.negated else ""
+        return f"{prefix}r/{self.pattern.pattern}/"
 
 
 class Target:
@@ -34,6 +46,10 @@ class Target:
 
     A Target can also depend on another Target, meaning that if A depends on B, and
     B is included in the list of matched Targets, then A will also be included.
+
+    Sources are glob patterns (see kitefly.util.glob) or compiled regular expressions.
+    Globs prefixed with "!" exclude files that would otherwise match the Target's
+    own patterns, e.g. Target.src("src/app", "!src/app/**/*.md").
     """
 
     def __init__(
@@ -51,35 +67,53 @@ class Target:
         default_priority = getattr(self, "priority", 0)
         self.priority = priority or default_priority
 
+    # Incremented whenever an edge is added to any Target, invalidating resolved graphs
+    _graph_version = 0
+
     @property
     def dependencies(self) -> Set["Target"]:
         """
         Return distinct set of Targets in the dependency graph
         """
-        deps: Set["Target"] = set()
-        for target in self.depends_on:
-            deps.add(target)
-            deps |= target.dependencies
-        return deps
+        return set(_graph.closure(self))
 
     def _iterate_patterns(self) -> Generator[TargetPattern, None, None]:
         """
-        Iterate recursively through all patterns in the depencency tree.
+        Iterate through all distinct patterns in the dependency tree.
         """
-        for pattern in self.patterns:
+        for pattern in _graph.patterns(self):
             yield pattern
-        for target in self.depends_on:
-            for pattern in target._iterate_patterns():
-                yield pattern
 
     def matches(self, filepath: str) -> bool:
         """
         Returns True if the Target patterns or any of its dependency patterns match the provided filepath.
         """
-        for pattern in self._iterate_patterns():
-            if pattern.matches(filepath):
-                return True
-        return False
+        closure = _graph.closure(self)
+        if self.matches_own(filepath):
+            return True
+        return any(dep.matches_own(filepath) for dep in closure)
+
+    def matches_own(self, filepath: str) -> bool:
+        """
+        Returns True if the Target's own patterns (ignoring dependencies) match the filepath.
+        """
+        matched = False
+        for pattern in self.patterns:
+            if pattern.negated:
+                if pattern.matches(filepath):
+                    return False
+            elif not matched:
+                matched = pattern.matches(filepath)
+        return matched
+
+    def match_many(self, filepaths: Iterable[str]) -> List[str]:
+        """
+        Return the sorted list of filepaths matching the Target or its dependencies.
+        To match many Targets against the same filepaths, use TargetSet.classify().
+        """
+        from .target_set import TargetSet
+
+        return TargetSet([self]).classify(filepaths).files(self)
 
     @classmethod
     def src(cls, *sources: Union[str, Pattern]) -> "Target":
@@ -91,6 +125,7 @@ class Target:
 
     def __rshift__(self, dep: "Target") -> "Target":
         self.depends_on.append(dep)
+        Target._graph_version += 1
         return dep
 
     def __lt__(self, comp: "Target") -> bool:
@@ -101,3 +136,109 @@ class Target:
     def __str__(self) -> str:
         plist = ",".join([str(p) for p in self.patterns])
         return f"Target(priority={self.priority},sources={plist})"
+
+
+class TargetCycleError(ValueError):
+    """
+    Raised when the Target dependency graph contains a cycle.
+    """
+
+    def __init__(self, path: List[Target]):
+        self.path = path
+        names = " -> ".join(t.name or str(t) for t in path)
+        super().__init__(f"Target dependency cycle: {names}")
+
+
+class TargetGraph:
+    """
+    Resolves the dependency closure and flattened pattern list of each Target
+    a single time, visiting dependencies before their dependents. Results are
+    cached until an edge is added to any Target via `>>`.
+    """
+
+    def __init__(self) -> None:
+        self._version = -1
+        self._closures: Dict[Target, Tuple[Target, ...]] = {}
+        self._patterns: Dict[Target, Tuple[TargetPattern, ...]] = {}
+
+    def closure(self, target: Target) -> Tuple[Target, ...]:
+        """
+        Return every Target the provided Target depends on, directly or transitively.
+        """
+        if self._check_version() or target not in self._closures:
+            self._visit(target, {}, self._closures)
+        return self._closures[target]
+
+    def patterns(self, target: Target) -> Tuple[TargetPattern, ...]:
+        """
+        Return the distinct patterns of the Target followed by those of its dependencies.
+        """
+        if self._check_version() or target not in self._patterns:
+            self._visit(target, {}, self._patterns)
+        return self._patterns[target]
+
+    def resolve(self, targets: Iterable[Target]) -> List[Target]:
+        """
+        Resolve the provided Targets and return them, along with all of their
+        dependencies, in topological order (dependencies first).
+
+        Raises TargetCycleError if a cycle is found.
+        """
+        self._check_version()
+        order: Dict[Target, None] = {}
+        for root in targets:
+            self._visit(root, order, order)
+        return list(order)
+
+    def _check_version(self) -> bool:
+        """
+        Drop resolved results if an edge was added since they were computed.
+        """
+        if self._version == Target._graph_version:
+            return False
+        self._closures.clear()
+        self._patterns.clear()
+        self._version = Target._graph_version
+        return True
+
+    def _visit(self, root: Target, order: Dict[Target, None], done: Container) -> None:
+        """
+        Add root and its unvisited dependencies to `order` in post-order, skipping any
+        Target contained in `done`.
+        """
+        if root in done:
+            return
+        # Iterative depth-first search; `path` holds the chain of Targets being
+        # visited, in order, so that a cycle can be reported precisely.
+        path: Dict[Target, None] = {root: None}
+        stack = [(root, iter(root.depends_on))]
+        while stack:
+            target, deps = stack[-1]
+            for dep in deps:
+                if dep in path:
+                    chain = list(path)
+                    raise TargetCycleError(chain[chain.index(dep):] + [dep])
+                if dep not in done:
+                    path[dep] = None
+                    stack.append((dep, iter(dep.depends_on)))
+                    break
+            else:
+                stack.pop()
+                del path[target]
+                order[target] = None
+                if target not in self._closures:
+                    self._flatten(target)
+
+    def _flatten(self, target: Target) -> None:
+        closure: Dict[Target, None] = {}
+        patterns = {id(p): p for p in target.patterns}
+        for dep in target.depends_on:
+            closure[dep] = None
+            closure.update(dict.fromkeys(self._closures[dep]))
+            for pattern in self._patterns[dep]:
+                patterns.setdefault(id(pattern), pattern)
+        self._closures[target] = tuple(closure)
+        self._patterns[target] = tuple(patterns.values())
+
+
+_graph = TargetGraph()
@@ -0,0 +1,292 @@
+import bisect
+import re
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Pattern, Set, Tuple
+
+from .target import Target, TargetPattern
+from ..util import Glob
+
+
+class TargetSet:
+    """
+    An index over a collection of Targets (and their dependencies) used to classify
+    many filepaths at once. Filepaths are sorted a single time, and every distinct
+    pattern is then evaluated once: globs with a literal prefix (e.g. `src/lib` or
+    `docs/**/*.md`) only inspect the range of paths sharing that prefix, suffix globs
+    (e.g. `**/*.py`) are looked up by hash, and the remaining patterns are merged into
+    alternations which reject non-matching paths without visiting each pattern.
+    """
+
+    def __init__(self, targets: Iterable[Target] = ()):
+        self._targets: Dict[Target, None] = {}
+        self._index: Optional["_PatternIndex"] = None
+        self.add(targets)
+
+    def add(self, targets: Iterable[Target]) -> None:
+        """
+        Add targets, along with every target in their dependency graph, to the set.
+        """
+        pending = list(targets)
+        while pending:
+            target = pending.pop()
+            if target in self._targets:
+                continue
+            self._targets[target] = None
+            self._index = None
+            pending.extend(target.depends_on)
+
+    def classify(self, filepaths: Iterable[str], presorted: bool = False) -> "TargetMatches":
+        """
+        Match every Target in the set against the filepaths, which may be passed
+        already sorted (and free of duplicates) with presorted=True.
+        """
+        paths = filepaths if presorted else sorted(set(filepaths))
+        if not isinstance(paths, list):
+            paths = list(paths)
+        if self._index is None:
+            self._index = _PatternIndex(self._targets)
+        index = self._index
+        files = index.scan(paths)
+        own_files: Dict[Target, List[str]] = {}
+        # Each file is owned by the matching Target with the highest priority, or
+        # the longest matching pattern when priorities are equal, and then the Target
+        # which sorts first by name and patterns, regardless of the order of the set
+        ranks: Dict[str, Tuple[int, int]] = {}
+        ties: Dict[str, Tuple[str, str]] = {}
+        owners: Dict[str, FileAssignment] = {}
+        shared: Dict[str, List[Target]] = {}
+        for target in self._targets:
+            tie = (target.name, str(target))
+            included: Set[str] = set()
+            excluded: Set[str] = set()
+            for pattern in target.patterns:
+                matches = files[_pattern_key(pattern)]
+                (excluded if pattern.negated else included).update(matches)
+            own = included - excluded
+            own_files[target] = sorted(own)
+            for pattern in target.patterns:
+                if pattern.negated:
+                    continue
+                rank = (target.priority or 0, len(pattern))
+                for path in files[_pattern_key(pattern)]:
+                    if path not in own:
+                        continue
+                    best = ranks.get(path)
+                    if best is None or rank > best or (rank == best and tie < ties[path]):
+                        ranks[path] = rank
+                        ties[path] = tie
+                        owners[path] = FileAssignment(path, target, pattern)
+                        shared.pop(path, None)
+                    elif rank == best and tie == ties[path]:
+                        # Indistinguishable Targets all own the file
+                        others = shared.setdefault(path, [])
+                        if owners[path].target is not target and target not in others:
+                            others.append(target)
+        return TargetMatches(own_files, owners, shared)
+
+    def matched(self, filepaths: Iterable[str]) -> Set[Target]:
+        """
+        Return the Targets whose patterns, or whose dependencies' patterns, match
+        at least one of the provided filepaths.
+        """
+        return self.classify(filepaths).matched
+
+    def __contains__(self, target: object) -> bool:
+        return target in self._targets
+
+    def __iter__(self) -> Iterator[Target]:
+        return iter(self._targets)
+
+    def __len__(self) -> int:
+        return len(self._targets)
+
+
+class FileAssignment(NamedTuple):
+    """
+    A changed file, and the Target (and its pattern, if known) which owns it.
+    """
+
+    path: str
+    target: Target
+    pattern: Optional[TargetPattern]
+
+
+class TargetMatches:
+    """
+    The result of classifying filepaths against a TargetSet.
+
+    Targets are `matched` if any of their patterns, or their dependencies' patterns,
+    match a file. Each file is also assigned to a single owning Target (see explain()),
+    and Targets are `owned` if they, or one of their dependencies, own a file.
+    """
+
+    def __init__(
+        self,
+        own_files: Dict[Target, List[str]],
+        owners: Optional[Dict[str, FileAssignment]] = None,
+        shared: Optional[Dict[str, List[Target]]] = None,
+    ):
+        self._own_files = own_files
+        self.owners: Dict[str, FileAssignment] = owners or {}
+        # Targets owning a file along with its owner, being indistinguishable from it
+        self.shared: Dict[str, List[Target]] = shared or {}
+        self.matched: Set[Target] = set()
+        for target, files in own_files.items():
+            if files or any(own_files.get(dep) for dep in target.dependencies):
+                self.matched.add(target)
+        owning = {assignment.target for assignment in self.owners.values()}
+        for targets in self.shared.values():
+            owning.update(targets)
+        self.owned: Set[Target] = set(owning)
+        for target in own_files:
+            if not owning.isdisjoint(target.dependencies):
+                self.owned.add(target)
+
+    def explain(self) -> List[FileAssignment]:
+        """
+        Return the assignment of every matched file to its owning Target, by path.
+
+        A file is owned by the matching Target with the highest priority, then the
+        longest matching pattern, and then the lowest (name, str(target)), so that
+        the owner doesn't depend on the order in which Targets were defined. Targets
+        equal in all of these all own the file (see `shared`), and only the first is
+        reported here.
+        """
+        return [self.owners[path] for path in sorted(self.owners)]
+
+    def own_files(self, target: Target) -> List[str]:
+        """
+        Return the files matching the Target's own patterns.
+        """
+        return list(self._own_files.get(target, []))
+
+    def files(self, target: Target) -> List[str]:
+        """
+        Return the files matching the Target or any of its dependencies.
+        """
+        files = set(self._own_files.get(target, []))
+        for dep in target.dependencies:
+            files.update(self._own_files.get(dep, []))
+        return sorted(files)
+
+    def __contains__(self, target: object) -> bool:
+        return target in self.matched
+
+
+PatternKey = Tuple[str, str, int]
+
+
+def _pattern_key(pattern: TargetPattern) -> PatternKey:
+    # Globs and regular expressions with the same source match differently (full
+    # match vs. prefix match), so they are keyed separately
+    kind = "glob" if pattern.glob is not None else "regex"
+    return (kind, pattern.pattern.pattern, pattern.pattern.flags)
+
+
+class _PatternIndex:
+    """
+    The distinct patterns of every Target in a TargetSet, grouped by the strategy
+    used to find the paths they match.
+    """
+
+    def __init__(self, targets: Iterable[Target]):
+        self.keys: Set[PatternKey] = set()
+        # globs with a literal prefix, matched against a range of the sorted paths
+        self.ranged: List[Tuple[PatternKey, TargetPattern]] = []
+        # `**/*<suffix>` globs: suffix length -> suffix -> key
+        self.suffixes: Dict[int, Dict[str, List[PatternKey]]] = {}
+        self.globs = _Alternation(full=True)
+        self.regexes = _Alternation(full=False)
+        # regexes with groups or flags, which are always checked on their own
+        self.individual: List[Tuple[PatternKey, TargetPattern]] = []
+        for target in targets:
+            for pattern in target.patterns:
+                key = _pattern_key(pattern)
+                if key not in self.keys:
+                    self.keys.add(key)
+                    self._add(key, pattern)
+
+    def _add(self, key: PatternKey, pattern: TargetPattern) -> None:
+        glob = pattern.glob
+        if glob is None:
+            if _is_combinable(pattern.pattern):
+                self.regexes.add(key, pattern)
+            else:
+                self.individual.append((key, pattern))
+        elif glob.literal_prefix:
+            self.ranged.append((key, pattern))
+        elif glob.kind == Glob.SUFFIX:
+            by_suffix = self.suffixes.setdefault(len(glob.value), {})
+            by_suffix.setdefault(glob.value, []).append(key)
+        else:
+            self.globs.add(key, pattern)
+
+    def scan(self, paths: List[str]) -> Dict[PatternKey, List[str]]:
+        """
+        Return the paths matched by each distinct pattern, given sorted paths.
+        """
+        files: Dict[PatternKey, List[str]] = {key: [] for key in self.keys}
+        for key, pattern in self.ranged:
+            glob = pattern.glob
+            assert glob is not None
+            start, end = _prefix_range(paths, glob.literal_prefix)
+            matches = pattern.matches
+            files[key] = [p for p in paths[start:end] if matches(p)]
+        if self.suffixes:
+            by_length = sorted(self.suffixes.items())
+            for path in paths:
+                for length, by_suffix in by_length:
+                    if length > len(path):
+                        break
+                    keys = by_suffix.get(path[-length:] if length else "")
+                    if keys:
+                        for key in keys:
+                            files[key].append(path)
+        self.globs.scan(paths, files)
+        self.regexes.scan(paths, files)
+        for key, pattern in self.individual:
+            files[key] = [p for p in paths if pattern.matches(p)]
+        return files
+
+
+class _Alternation:
+    """
+    Patterns combined into a single alternation, used to quickly reject paths
+    before checking each individual pattern.
+    """
+
+    def __init__(self, full: bool):
+        self.full = full
+        self.patterns: List[Tuple[PatternKey, Pattern]] = []
+
+    def add(self, key: PatternKey, pattern: TargetPattern) -> None:
+        self.patterns.append((key, pattern.pattern))
+
+    def scan(self, paths: List[str], files: Dict[PatternKey, List[str]]) -> None:
+        if not self.patterns:
+            return
+        combined = re.compile("|".join(f"(?:{p.pattern})" for _, p in self.patterns))
+        if self.full:
+            candidates = [p for p in paths if combined.fullmatch(p)]
+            for key, regex in self.patterns:
+                files[key] = [p for p in candidates if regex.fullmatch(p)]
+        else:
+            candidates = [p for p in paths if combined.match(p)]
+            for key, regex in self.patterns:
+                files[key] = [p for p in candidates if regex.match(p)]
+
+
+def _prefix_range(paths: List[str], prefix: str) -> Tuple[int, int]:
+    """
+    Return the range of indexes of the sorted paths which start with prefix.
+    """
+    start = bisect.bisect_left(paths, prefix)
+    end = bisect.bisect_left(paths, prefix[:-1] + chr(ord(prefix[-1]) + 1), start)
+    return start, end
+
+
+def _is_combinable(regex: Pattern) -> bool:
+    """
+    Return True if the regex has no groups or flags, so it can be safely concatenated
+    into one alternation.
+    """
+    return regex.groups == 0 and regex.flags == re.compile("").flags
@@ -41,6 +41,8 @@ class Trigger(Step):
 
   See: https://buildkite.com/docs/pipelines/trigger-step
   """
+  __slots__ = ("pipeline", "build", "label", "asynchronous")
+
   def __init__(
     self,
     pipeline: str,
@@ -6,6 +6,8 @@ class Wait(Step):
 
   See: https://buildkite.com/docs/pipelines/wait-step
   """
+  __slots__ = ("continue_on_failure",)
+
   def __init__(
     self,
     continue_on_failure: bool = False,
@@ -0,0 +1,126 @@
+"""
+Evaluate a function over contiguous partitions of a list of steps in a pool of worker
+processes, used for parallel filtering and rendering of large pipelines.
+
+Where the platform supports forking, workers inherit the steps (along with the class
+defaults already resolved for them) from the parent process, so only partition bounds
+are sent to workers and only results are pickled back. Otherwise, each partition is
+pickled and sent to a worker. If the pool can't be used, for example because a step
+can't be pickled, the partitions are evaluated serially instead. They are also
+evaluated serially while other threads are running (such as a GitFilter prefetching
+its changed files), as a forked worker could deadlock on a lock held by one of them.
+
+Workers run on copies of the function and its arguments, so state they change (such
+as the verdicts cached by a filter) is not seen by the calling process.
+"""
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+logger = logging.getLogger("kitefly.parallel")
+
+# Partitions per worker, so that uneven partitions are balanced across workers
+PARTITIONS_PER_WORKER = 4
+
+_shared: Dict[int, Tuple[Callable[[Sequence[Any]], Any], Sequence[Any]]] = {}
+_tokens = itertools.count()
+
+
+def resolve_workers(workers: int) -> int:
+    """
+    Return the number of worker processes to use: `workers` if positive, otherwise
+    one per CPU when negative, and 0 (serial) when 0.
+    """
+    if workers < 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def partition(items: Sequence[T], count: int, weight: Callable[[T], int]) -> List[Tuple[int, int]]:
+    """
+    Split items into at most `count` contiguous (start, end) ranges of similar total
+    weight.
+    """
+    if not items:
+        return []
+    weights = [max(weight(item), 1) for item in items]
+    target = sum(weights) / max(count, 1)
+    ranges: List[Tuple[int, int]] = []
+    start = 0
+    total = 0
+    for i, w in enumerate(weights):
+        total += w
+        if total >= target * (len(ranges) + 1) and i + 1 < len(items):
+            ranges.append((start, i + 1))
+            start = i + 1
+    ranges.append((start, len(items)))
+    return ranges
+
+
+def map_partitions(
+    func: Callable[[Sequence[T]], R],
+    items: Sequence[T],
+    workers: int,
+    weight: Callable[[T], int] = lambda item: 1,
+) -> List[R]:
+    """
+    Return [func(partition) for each partition of items], in order, evaluating the
+    partitions in up to `workers` processes. `func` must be a module-level function.
+    """
+    workers = resolve_workers(workers)
+    ranges = partition(items, workers * PARTITIONS_PER_WORKER, weight)
+    if workers > 1 and len(ranges) > 1 and _can_use_pool():
+        try:
+            return _map_in_pool(func, items, ranges, workers)
+        except Exception as e:
+            logger.debug("parallel evaluation failed, falling back to serial: %r", e)
+    return [func(items[start:end]) for start, end in ranges]
+
+
+def _can_use_pool() -> bool:
+    """
+    Return False if workers would be forked while other threads are running.
+    """
+    if threading.active_count() > 1 and "fork" in multiprocessing.get_all_start_methods():
+        logger.debug("other threads are running, evaluating partitions serially")
+        return False
+    return True
+
+
+def _map_in_pool(
+    func: Callable[[Sequence[T]], R],
+    items: Sequence[T],
+    ranges: List[Tuple[int, int]],
+    workers: int,
+) -> List[R]:
+    workers = min(workers, len(ranges))
+    if "fork" in multiprocessing.get_all_start_methods():
+        token = next(_tokens)
+        _shared[token] = (func, items)
+        try:
+            context = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(workers, mp_context=context) as executor:
+                futures = [
+                    executor.submit(_run_shared, token, start, end)
+                    for start, end in ranges
+                ]
+                return [future.result() for future in futures]
+        finally:
+            del _shared[token]
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [
+            executor.submit(func, list(items[start:end])) for start, end in ranges
+        ]
+        return [future.result() for future in futures]
+
+
+def _run_shared(token: int, start: int, end: int) -> Any:
+    func, items = _shared[token]
+    return func(items[start:end])
@@ -0,0 +1,191 @@
+"""
+Answer "which steps would run for these changed files?" without rendering the pipeline.
+
+A PipelineQuery indexes the Targets of every step of a pipeline once, and can then
+classify many sets of changed files, reporting the key of each affected step along
+with the files, Targets and patterns which selected it. Selection follows GitFilter,
+including the steps which depend on selected steps and are therefore added to the
+pipeline as well.
+"""
+import collections
+import os
+import runpy
+import sys
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from .model.group import Group
+from .model.pipeline import Pipeline
+from .model.step import Step
+from .model.target import Target, TargetPattern
+from .model.target_set import FileAssignment, TargetMatches, TargetSet
+from .util import KeyRegistry, key_scope
+
+# Name used to run definition files, so that code guarded by
+# `if __name__ == "__main__":` (such as printing the YAML) is not run
+DEFINITION_RUN_NAME = "__kitefly__"
+
+
+def load_pipeline(
+    path: str, name: str = "pipeline", registry: Optional[KeyRegistry] = None
+) -> Pipeline:
+    """
+    Run a pipeline definition file and return its Pipeline: the module-level variable
+    `name`, which may also be a function returning the Pipeline, or otherwise the last
+    Pipeline defined at module level. Keys are generated in a new key scope (or from
+    the registry provided), so they are the same as when the file is run in a new
+    process.
+    """
+    path = os.path.abspath(path)
+    directory = os.path.dirname(path)
+    sys.path.insert(0, directory)
+    try:
+        with key_scope(registry):
+            namespace = runpy.run_path(path, run_name=DEFINITION_RUN_NAME)
+            value = namespace.get(name)
+            if callable(value) and not isinstance(value, Pipeline):
+                value = value()
+    finally:
+        if sys.path and sys.path[0] == directory:
+            del sys.path[0]
+    if isinstance(value, Pipeline):
+        return value
+    pipelines = [v for v in namespace.values() if isinstance(v, Pipeline)]
+    if not pipelines:
+        raise ValueError(f"No Pipeline named {name!r} found in {path}")
+    return pipelines[-1]
+
+
+class AffectedStep(NamedTuple):
+    """
+    A step which would run, the changed files (and the Target and pattern each was
+    assigned to) which selected it, and the keys of the selected steps it depends on,
+    if it was only included as their dependent.
+    """
+
+    key: str
+    label: str
+    matches: List[FileAssignment]
+    dependent_of: List[str]
+
+    def asdict(self) -> Dict[str, Any]:
+        return {
+            "key": self.key,
+            "label": self.label,
+            "matches": [
+                {
+                    "path": m.path,
+                    "target": m.target.name or str(m.target),
+                    "pattern": pattern_source(m.pattern),
+                }
+                for m in self.matches
+            ],
+            "dependent_of": self.dependent_of,
+        }
+
+
+def pattern_source(pattern: Optional[TargetPattern]) -> str:
+    """
+    Return the source of a TargetPattern: its glob, or its regular expression.
+    """
+    if pattern is None:
+        return ""
+    if pattern.glob is not None:
+        return pattern.glob.source
+    return str(pattern)
+
+
+class PipelineQuery:
+    """
+    Indexes of the steps of a pipeline by Target, used to find the steps affected by
+    sets of changed files. With exclusive=False, steps are selected when any of their
+    Targets match a file, rather than only the Target owning it (see GitFilter).
+    """
+
+    def __init__(self, pipeline: Pipeline, exclusive: bool = True):
+        self.pipeline = pipeline
+        self.exclusive = exclusive
+        self.steps: List[Step] = []
+        self.steps_by_target: Dict[Target, List[Step]] = {}
+        seen = set()
+        pending = collections.deque(pipeline.items)
+        while pending:
+            step = pending.popleft()
+            if id(step) in seen:
+                continue
+            seen.add(id(step))
+            if isinstance(step, Group):
+                pending.extendleft(reversed(step.steps))
+                continue
+            self.steps.append(step)
+            for target in step.get_targets():
+                self.steps_by_target.setdefault(target, []).append(step)
+            pending.extend(step.dependents)
+        self.target_set = TargetSet(self.steps_by_target)
+        # Build the pattern index up-front, rather than in the first query
+        self.target_set.classify([])
+
+    def query(self, paths: Iterable[str]) -> List[AffectedStep]:
+        """
+        Return the steps which would run for the changed files, in pipeline order.
+        """
+        matches = self.target_set.classify(paths)
+        selected = matches.owned if self.exclusive else matches.matched
+        owned: Dict[Target, List[FileAssignment]] = {}
+        for assignment in matches.explain():
+            owned.setdefault(assignment.target, []).append(assignment)
+        affected: Dict[int, AffectedStep] = {}
+        for target in selected:
+            for step in self.steps_by_target.get(target, ()):
+                if id(step) not in affected:
+                    found = self._matches(step, matches, owned)
+                    affected[id(step)] = AffectedStep(step.key, _label(step), found, [])
+        # Steps depending on affected steps are included by Pipeline as well
+        pending = collections.deque(s for s in self.steps if id(s) in affected)
+        while pending:
+            step = pending.popleft()
+            for dependent in step.dependents:
+                dependents = [dependent]
+                if isinstance(dependent, Group):
+                    dependents = dependent.steps
+                for d in dependents:
+                    if id(d) not in affected:
+                        affected[id(d)] = AffectedStep(d.key, _label(d), [], [])
+                        pending.append(d)
+                    if not affected[id(d)].matches and step.key:
+                        affected[id(d)].dependent_of.append(step.key)
+        return [affected[id(s)] for s in self.steps if id(s) in affected]
+
+    def _matches(
+        self,
+        step: Step,
+        matches: TargetMatches,
+        owned: Dict[Target, List[FileAssignment]],
+    ) -> List[FileAssignment]:
+        targets = set()
+        for target in step.get_targets():
+            targets.add(target)
+            targets.update(target.dependencies)
+        found: List[FileAssignment] = []
+        if self.exclusive:
+            for target in targets:
+                found += owned.get(target, [])
+        else:
+            for target in targets:
+                for path in matches.own_files(target):
+                    pattern = next(
+                        (p for p in target.patterns if not p.negated and p.matches(path)),
+                        None,
+                    )
+                    found.append(FileAssignment(path, target, pattern))
+        return sorted(found, key=lambda m: m.path)
+
+
+def _label(step: Step) -> str:
+    return getattr(step, "label", "") or ""
+
+
+def query_result(steps: List[AffectedStep]) -> Dict[str, Any]:
+    """
+    Return the JSON-compatible form of the result of a query.
+    """
+    return {"steps": [step.asdict() for step in steps]}
@@ -0,0 +1,66 @@
+import json
+from typing import Any, Iterable, List, Optional, TextIO
+
+
+def yaml_dumper() -> Any:
+    """
+    Return the fastest available PyYAML Dumper class: the libyaml-backed CDumper
+    when PyYAML was built with it, otherwise the pure-Python Dumper. Both produce
+    identical output for the plain data generated by asdict().
+    """
+    import yaml
+
+    return getattr(yaml, "CDumper", yaml.Dumper)
+
+
+def dump_yaml(data: Any) -> str:
+    """
+    Serialize plain data (as returned by asdict()) to YAML.
+    """
+    import yaml
+
+    return yaml.dump(data, Dumper=yaml_dumper())
+
+
+def dump_json(data: Any, indent: Optional[int] = None) -> str:
+    """
+    Serialize plain data (as returned by asdict()) to JSON, with keys sorted in the
+    same order as the YAML output.
+    """
+    return json.dumps(data, indent=indent, sort_keys=True)
+
+
+def dump_yaml_fragment(steps: List[dict]) -> str:
+    """
+    Serialize steps as items of the top-level `steps` sequence of a pipeline document,
+    so that fragments can be rendered separately and joined with join_yaml_fragments.
+    Objects shared between fragments are written out in full in each fragment.
+    """
+    import yaml
+
+    if not steps:
+        return ""
+    return yaml.dump(steps, Dumper=yaml_dumper())
+
+
+def join_yaml_fragments(fragments: Iterable[str]) -> str:
+    body = "".join(fragments)
+    return "steps:\n" + body if body else "steps: []\n"
+
+
+def write_yaml_steps(steps: Iterable[dict], stream: TextIO) -> None:
+    """
+    Write a pipeline document to the stream, serializing one step at a time.
+
+    The output is identical to dump_yaml({"steps": [...]}), except that objects
+    shared between two different steps are written out in full for each step
+    rather than as YAML aliases.
+    """
+    empty = True
+    for step in steps:
+        if empty:
+            stream.write("steps:\n")
+            empty = False
+        stream.write(dump_yaml_fragment([step]))
+    if empty:
+        stream.write("steps: []\n")
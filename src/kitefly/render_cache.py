@@ -0,0 +1,168 @@
+"""
+Caches of rendered YAML, keyed by a fingerprint of the plain data of each step, so
+that regenerating a pipeline only serializes the steps that changed.
+
+The fingerprint is taken from asdict(), which merges class defaults with the fields,
+depends_on and plugins of the step, so it covers exactly what is rendered. Producing
+the plain data is cheap compared to serializing it as YAML.
+"""
+import collections
+import hashlib
+import os
+import pickle
+import sys
+from typing import Any, Iterator, Optional, Tuple
+
+from . import __version__
+
+# A fixed protocol, so fingerprints are stable between Python versions that support it
+PICKLE_PROTOCOL = 4
+
+
+def data_fingerprint(data: Any) -> Optional[str]:
+    """
+    Return the fingerprint of plain data (as returned by asdict()), or None if it
+    contains objects which can't be fingerprinted.
+    """
+    try:
+        encoded = pickle.dumps(data, protocol=PICKLE_PROTOCOL)
+    except Exception:
+        return None
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def _namespace() -> str:
+    """
+    Identify the versions of kitefly, Python and PyYAML, which also determine the
+    output.
+    """
+    import yaml
+
+    from .render import yaml_dumper
+
+    python = "%d.%d" % sys.version_info[:2]
+    return f"{__version__}:{python}:{yaml.__version__}:{yaml_dumper().__name__}"
+
+
+class RenderCache:
+    """
+    An in-memory cache of rendered YAML fragments, keyed by data fingerprint. At most
+    max_entries fragments are kept, evicting the least recently used.
+
+    Pass a cache to Pipeline.asyaml(cache=...) to reuse the fragments of unchanged
+    steps between renders in the same process.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "collections.OrderedDict[str, str]" = collections.OrderedDict()
+        self._namespace = _namespace()
+
+    def key(self, fingerprint: str) -> str:
+        return hashlib.sha1(f"{self._namespace}:{fingerprint}".encode("utf8")).hexdigest()
+
+    def get(self, fingerprint: str) -> Optional[str]:
+        key = self.key(fingerprint)
+        fragment = self._entries.get(key)
+        if fragment is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return fragment
+
+    def put(self, fingerprint: str, fragment: str) -> None:
+        key = self.key(fingerprint)
+        self._entries[key] = fragment
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def flush(self) -> None:
+        """
+        Called after each render, once all fragments have been stored.
+        """
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskRenderCache(RenderCache):
+    """
+    Persist rendered YAML fragments as files in a directory, by default
+    `kitefly/render` within the repository's git directory, so that unchanged steps
+    are not serialized again by later builds on the same agent. At most max_entries
+    fragments are kept, evicting the least recently used after each render.
+    """
+
+    def __init__(self, directory: str = "", max_entries: int = 100_000):
+        super().__init__(max_entries)
+        self._directory = directory
+        self._added = 0
+
+    @property
+    def directory(self) -> str:
+        if not self._directory:
+            from .filter.git_refs import find_git_dir
+
+            git_dir = find_git_dir()
+            if not git_dir:
+                raise ValueError("No directory provided and not inside a git repository")
+            self._directory = os.path.join(git_dir, "kitefly", "render")
+        return self._directory
+
+    def get(self, fingerprint: str) -> Optional[str]:
+        path = self._path(self.key(fingerprint))
+        try:
+            with open(path, encoding="utf8") as stream:
+                fragment = stream.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Refresh the modification time, which orders entries for eviction, unless
+        # another process evicted the entry since it was read
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return fragment
+
+    def put(self, fingerprint: str, fragment: str) -> None:
+        path = self._path(self.key(fingerprint))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = f"{path}.{os.getpid()}.tmp"
+        with open(partial, "w", encoding="utf8") as stream:
+            stream.write(fragment)
+        os.replace(partial, path)
+        self._added += 1
+
+    def flush(self) -> None:
+        if self._added:
+            self._added = 0
+            self._evict()
+
+    def _path(self, key: str) -> str:
+        # Entries are spread across subdirectories to keep directories small
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def _entries_by_age(self) -> Iterator[Tuple[float, str]]:
+        for subdirectory in os.scandir(self.directory):
+            if not subdirectory.is_dir():
+                continue
+            for entry in os.scandir(subdirectory.path):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    yield entry.stat().st_mtime, entry.path
+
+    def _evict(self) -> None:
+        entries = sorted(self._entries_by_age())
+        for _, path in entries[: max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._entries_by_age())
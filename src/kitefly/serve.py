@@ -0,0 +1,236 @@
+"""
+A long-running process which keeps a pipeline definition loaded, so that each build
+renders the pipeline without paying for Python startup, imports, running the
+definition and compiling Target patterns again.
+
+The definition is run again only when it, or a module it imported from its own
+directory, has changed: files whose modification time or size differ are hashed, and
+reloaded if their contents changed. Rendered steps are kept in a RenderCache, so a
+reload only serializes the steps that changed.
+
+Requests and responses are JSON objects, one per line, on a Unix socket (see
+kitefly.unix_socket):
+
+    {"command": "render", "base_branch": "main", "cwd": "/builds/repo", "head": "<sha>"}
+    {"output": "steps:\\n..."}
+
+Without a base_branch, the whole pipeline is rendered, and with one, it is first
+filtered with a GitFilter for that branch, run in the client's working directory
+(cwd). Requests for a checkout whose HEAD isn't the client's (such as a server on
+another host), or for another definition file, are rejected as mismatched, and the
+client can then render the pipeline itself.
+"""
+import hashlib
+import os
+import sys
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from .filter.git_filter import GitFilter
+from .filter.git_refs import find_git_dir, resolve_ref
+from .model.pipeline import Pipeline
+from .query import load_pipeline
+from .render_cache import RenderCache
+from .util import KeyRegistry, key_scope
+
+FORMATS = ("yaml", "json")
+
+# The modification time, size and content hash of a watched file
+Stamp = Tuple[int, int, str]
+
+
+class CheckoutMismatch(ValueError):
+    """
+    Raised when a request is for a checkout or definition the server can't render.
+    """
+
+
+def head_commit(cwd: str = "") -> str:
+    """
+    Return the SHA of HEAD in the repository containing cwd, or "" if unknown.
+    """
+    git_dir = find_git_dir(cwd)
+    return (git_dir and resolve_ref(git_dir, "HEAD")) or ""
+
+
+def _stamp(path: str, previous: Optional[Stamp] = None) -> Optional[Stamp]:
+    """
+    Return the stamp of a file, or None if it no longer exists. The file is only
+    hashed if its modification time or size differ from the previous stamp.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if previous and previous[:2] == (stat.st_mtime_ns, stat.st_size):
+        return previous
+    with open(path, "rb") as stream:
+        digest = hashlib.sha1(stream.read()).hexdigest()
+    return stat.st_mtime_ns, stat.st_size, digest
+
+
+class PipelineServer:
+    """
+    Keeps the Pipeline of a definition file loaded (see load_pipeline), reloading it
+    when the definition changes, and renders it on request. Requests are handled one
+    at a time.
+    """
+
+    def __init__(
+        self, definition: str, name: str = "pipeline", cache: Optional[RenderCache] = None
+    ):
+        self.definition = os.path.abspath(definition)
+        self.name = name
+        self.cache = RenderCache() if cache is None else cache
+        self.loads = 0
+        self.renders = 0
+        self.watched: Dict[str, Stamp] = {}
+        self._pipeline: Optional[Pipeline] = None
+        self._key_counts: Dict[str, int] = {}
+        self._modules: Tuple[str, ...] = ()
+        self._lock = threading.Lock()
+
+    @property
+    def pipeline(self) -> Pipeline:
+        """
+        Return the loaded Pipeline, first reloading the definition if it changed.
+        """
+        return self.load()
+
+    def load(self) -> Pipeline:
+        """
+        Load the definition, or reload it if it changed, and return its Pipeline.
+        """
+        with self._lock:
+            self._refresh()
+            assert self._pipeline is not None
+            return self._pipeline
+
+    def is_stale(self) -> bool:
+        """
+        Return True if the definition has not been loaded, or a watched file changed.
+        """
+        if self._pipeline is None:
+            return True
+        stale = False
+        for path, stamp in self.watched.items():
+            current = _stamp(path, stamp)
+            if current is None or current[2] != stamp[2]:
+                stale = True
+            else:
+                self.watched[path] = current
+        return stale
+
+    def _refresh(self) -> bool:
+        if not self.is_stale():
+            return False
+        # Modules imported by the previous load are imported again
+        for module in self._modules:
+            sys.modules.pop(module, None)
+        self._pipeline = None
+        self.watched = {}
+        registry = KeyRegistry()
+        try:
+            pipeline = load_pipeline(self.definition, self.name, registry)
+        finally:
+            self._modules = tuple(
+                name for name, module in list(sys.modules.items()) if self._is_local(module)
+            )
+            paths = [self.definition]
+            for name in self._modules:
+                path = getattr(sys.modules.get(name), "__file__", None)
+                if path:
+                    paths.append(path)
+            for path in paths:
+                stamp = _stamp(path)
+                if stamp:
+                    self.watched[path] = stamp
+        self._pipeline = pipeline
+        self._key_counts = dict(registry.counts)
+        self.loads += 1
+        return True
+
+    def _is_local(self, module: Any) -> bool:
+        """
+        Return True if the module was loaded from the directory of the definition,
+        excluding installed packages (e.g. in a virtualenv within the repository).
+        """
+        path = getattr(module, "__file__", None)
+        if not path or module.__name__.split(".")[0] == "kitefly":
+            return False
+        path = os.path.abspath(path)
+        directory = os.path.dirname(self.definition)
+        return path.startswith(directory + os.sep) and "site-packages" not in path
+
+    def render(
+        self, base_branch: str = "", format: str = "yaml", cwd: str = "", head: str = ""
+    ) -> str:
+        """
+        Render the pipeline, filtered against the files changed relative to the base
+        branch if one is given, with git run in cwd (default: the current directory).
+        Raises CheckoutMismatch if cwd doesn't exist here, or its HEAD isn't head.
+        """
+        if format not in FORMATS:
+            raise ValueError(f"format must be one of {FORMATS}, got {format!r}")
+        if cwd and not os.path.isdir(cwd):
+            raise CheckoutMismatch(f"{cwd} does not exist on the server")
+        if head and head_commit(cwd) != head:
+            raise CheckoutMismatch(f"HEAD of {cwd or os.getcwd()} is not {head}")
+        with self._lock:
+            self._refresh()
+            assert self._pipeline is not None
+            # Keys generated while rendering continue from where loading left off, as
+            # they would in a new process
+            with key_scope(KeyRegistry(counts=dict(self._key_counts))):
+                pipeline = self._pipeline
+                if base_branch:
+                    pipeline = pipeline.filtered(GitFilter(base_branch, cwd=cwd))
+                if format == "json":
+                    output = pipeline.asjson()
+                else:
+                    output = pipeline.asyaml(cache=self.cache)
+            self.renders += 1
+            return output
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "definition": self.definition,
+            "loads": self.loads,
+            "renders": self.renders,
+            "watched": sorted(self.watched),
+            "cache": {
+                "entries": len(self.cache),
+                "hits": self.cache.hits,
+                "misses": self.cache.misses,
+            },
+        }
+
+    def handle(self, message: Any) -> Dict[str, Any]:
+        """
+        Answer a request: {"command": "render", "base_branch": ..., "format": ...,
+        "cwd": ..., "head": ..., "definition": ...} or {"command": "status"}. A
+        mismatched checkout or definition is answered with {"error": ..., "mismatch":
+        true}.
+        """
+        if not isinstance(message, dict):
+            raise ValueError("Expected a JSON object")
+        command = message.get("command", "render")
+        if command == "render":
+            try:
+                definition = message.get("definition")
+                if definition and os.path.realpath(definition) != os.path.realpath(
+                    self.definition
+                ):
+                    raise CheckoutMismatch(f"The server renders {self.definition}")
+                output = self.render(
+                    message.get("base_branch") or "",
+                    message.get("format") or "yaml",
+                    message.get("cwd") or "",
+                    message.get("head") or "",
+                )
+            except CheckoutMismatch as e:
+                return {"error": str(e), "mismatch": True}
+            return {"output": output}
+        if command == "status":
+            return self.status()
+        raise ValueError(f"Unknown command {command!r}")
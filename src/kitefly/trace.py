@@ -0,0 +1,106 @@
+"""
+Opt-in instrumentation of the phases of pipeline generation (filter, resolve and
+render). Nothing is measured unless a callback is registered, or the
+`kitefly.trace` logger is enabled for DEBUG, so the cost when disabled is a
+single check per phase.
+
+Example:
+
+    with trace.recording() as recorder:
+        print(pipeline.filtered(GitFilter()).asyaml())
+    print(recorder.timings)
+"""
+import contextlib
+import logging
+import time
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, NamedTuple
+
+logger = logging.getLogger("kitefly.trace")
+
+
+class TraceEvent(NamedTuple):
+    phase: str
+    duration: float
+    items: int
+
+
+TraceCallback = Callable[[TraceEvent], None]
+
+_callbacks: List[TraceCallback] = []
+_disabled: ContextManager[Any] = contextlib.nullcontext()
+
+
+def add_callback(callback: TraceCallback) -> None:
+    """
+    Register a callback invoked with a TraceEvent at the end of each traced phase.
+    """
+    _callbacks.append(callback)
+
+
+def remove_callback(callback: TraceCallback) -> None:
+    _callbacks.remove(callback)
+
+
+def enabled() -> bool:
+    return bool(_callbacks) or logger.isEnabledFor(logging.DEBUG)
+
+
+def span(phase: str, items: int = 0) -> ContextManager[Any]:
+    """
+    Time the enclosed block as the named phase, which processed the number of items.
+    """
+    if not _callbacks and not logger.isEnabledFor(logging.DEBUG):
+        return _disabled
+    return _Span(phase, items)
+
+
+def emit(event: TraceEvent) -> None:
+    logger.debug(
+        "%s: %.3fms (%d items)", event.phase, event.duration * 1000, event.items
+    )
+    for callback in list(_callbacks):
+        callback(event)
+
+
+class _Span:
+    def __init__(self, phase: str, items: int):
+        self.phase = phase
+        self.items = items
+        self.start = 0.0
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        emit(TraceEvent(self.phase, time.perf_counter() - self.start, self.items))
+
+
+class Recorder:
+    """
+    A trace callback which accumulates total time, item counts and number of calls
+    for each phase.
+    """
+
+    def __init__(self) -> None:
+        self.timings: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.calls: Dict[str, int] = {}
+
+    def __call__(self, event: TraceEvent) -> None:
+        self.timings[event.phase] = self.timings.get(event.phase, 0.0) + event.duration
+        self.counts[event.phase] = self.counts.get(event.phase, 0) + event.items
+        self.calls[event.phase] = self.calls.get(event.phase, 0) + 1
+
+
+@contextlib.contextmanager
+def recording() -> Iterator[Recorder]:
+    """
+    Record all traced phases within the block.
+    """
+    recorder = Recorder()
+    add_callback(recorder)
+    try:
+        yield recorder
+    finally:
+        remove_callback(recorder)
@@ -0,0 +1,78 @@
+"""
+A minimal JSON lines protocol over Unix domain sockets: clients send one JSON value
+per line, and the server answers each with one JSON object per line.
+"""
+import json
+import os
+import socket
+import socketserver
+import stat
+from typing import Any, Callable, Dict, Optional
+
+Handler = Callable[[Any], Dict[str, Any]]
+
+
+def serve(path: str, handler: Handler, ready: Optional[Callable[[], None]] = None) -> None:
+    """
+    Answer requests on a Unix socket at path until interrupted, passing each request to
+    the handler in a separate thread. Exceptions raised by the handler are returned as
+    {"error": message}. A stale socket left at the path by a server which exited is
+    replaced, and FileExistsError is raised if the path is anything else, including
+    the socket of a running server.
+    """
+    _remove_stale_socket(path)
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self) -> None:
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    response = handler(json.loads(line))
+                except Exception as e:
+                    response = {"error": f"{type(e).__name__}: {e}"}
+                self.wfile.write(json.dumps(response).encode("utf8") + b"\n")
+                self.wfile.flush()
+
+    server = socketserver.ThreadingUnixStreamServer(path, RequestHandler)
+    server.daemon_threads = True
+    try:
+        if ready:
+            ready()
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _remove_stale_socket(path: str) -> None:
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.remove(path)
+            return
+    raise FileExistsError(f"{path} is in use by a running server")
+
+
+def request(path: str, message: Any, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Send a single request to the server at path and return its response.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(path)
+        client.sendall(json.dumps(message).encode("utf8") + b"\n")
+        client.shutdown(socket.SHUT_WR)
+        with client.makefile("rb") as stream:
+            line = stream.readline()
+    if not line:
+        raise ConnectionError(f"No response from {path}")
+    return json.loads(line)
@@ -0,0 +1,155 @@
+"""
+Splitting of large pipelines into several smaller uploads, which are passed to
+`buildkite-agent pipeline upload` one after another.
+
+Top-level steps are never split, so a Group is always uploaded as a whole. Chunks are
+cut so that every step is uploaded in the same chunk as, or a later chunk than, the
+steps it depends on, and are preferably cut just before a Wait. A chunk never ends
+with a Wait, which instead begins the following chunk.
+"""
+import os
+import subprocess
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .model.group import Group
+from .model.matrix import Matrix
+from .model.step import Step
+from .model.wait import Wait
+
+# A conservative default for the number of steps in each upload
+MAX_STEPS = 500
+
+
+def step_count(step: Step) -> int:
+    """
+    Return the number of steps uploaded for a top-level step.
+    """
+    if isinstance(step, Group):
+        return step.size + 1
+    if isinstance(step, Matrix):
+        return step.size + 1
+    return 1
+
+
+def plan_chunks(
+    steps: Sequence[Step],
+    sizes: Sequence[int],
+    max_steps: int = MAX_STEPS,
+    max_bytes: int = 0,
+) -> List[Tuple[int, int]]:
+    """
+    Return the (start, end) ranges of the top-level steps uploaded in each chunk, given
+    the size in bytes of each step. A chunk only exceeds the limits when it consists of
+    steps which can't be split, such as a single large Group.
+    """
+    joined = _joined(steps)
+    counts = [step_count(step) for step in steps]
+    ranges: List[Tuple[int, int]] = []
+    start = 0
+    total_steps = 0
+    total_bytes = 0
+    for i in range(len(steps)):
+        while i > start and (
+            total_steps + counts[i] > max_steps
+            or (max_bytes and total_bytes + sizes[i] > max_bytes)
+        ):
+            cut = _cut_point(steps, joined, start, i)
+            if cut is None:
+                break
+            ranges.append((start, cut))
+            start = cut
+            total_steps = sum(counts[start:i])
+            total_bytes = sum(sizes[start:i])
+        total_steps += counts[i]
+        total_bytes += sizes[i]
+    if start < len(steps):
+        ranges.append((start, len(steps)))
+    return ranges
+
+
+def _joined(steps: Sequence[Step]) -> List[bool]:
+    """
+    Return, for each position, whether the chunk can't be cut just before that step:
+    either the step is inside a range between a step and a later step it depends on,
+    or it follows a Wait, which must not end a chunk.
+    """
+    positions: Dict[str, int] = {}
+    for i, step in enumerate(steps):
+        for key in _keys(step):
+            positions.setdefault(key, i)
+    # the furthest later position each step depends on
+    reach = list(range(len(steps)))
+    for i, step in enumerate(steps):
+        for child in _children(step):
+            for key in child.depends_on:
+                j = positions.get(key)
+                if j is not None and j > i:
+                    reach[i] = max(reach[i], j)
+    joined = [False] * len(steps)
+    furthest = -1
+    for i, step in enumerate(steps):
+        if i and (i <= furthest or isinstance(steps[i - 1], Wait)):
+            joined[i] = True
+        furthest = max(furthest, reach[i])
+    return joined
+
+
+def _cut_point(steps: Sequence[Step], joined: List[bool], start: int, end: int) -> Optional[int]:
+    """
+    Return the best position in (start, end] to end a chunk: preferably before the
+    last Wait, otherwise as late as possible.
+    """
+    candidates = [i for i in range(start + 1, end + 1) if i == len(steps) or not joined[i]]
+    if not candidates:
+        return None
+    waits = [i for i in candidates if i < len(steps) and isinstance(steps[i], Wait)]
+    return waits[-1] if waits else candidates[-1]
+
+
+def _keys(step: Step) -> List[str]:
+    keys = [step.key] if step.key else []
+    if isinstance(step, Group):
+        keys += [child.key for child in step.iter_steps() if child.key]
+    return keys
+
+
+def _children(step: Step) -> List[Step]:
+    if isinstance(step, Group):
+        return [step, *step.iter_steps()]
+    return [step]
+
+
+def write_chunks(chunks: Sequence[str], directory: str, prefix: str = "pipeline") -> List[str]:
+    """
+    Write each chunk to a numbered file in the directory, returning their paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i, chunk in enumerate(chunks, start=1):
+        path = os.path.join(directory, f"{prefix}-{i:03d}.yml")
+        with open(path, "w", encoding="utf8") as stream:
+            stream.write(chunk)
+        paths.append(path)
+    return paths
+
+
+def upload_chunks(
+    chunks: Sequence[str],
+    agent: str = "buildkite-agent",
+    args: Sequence[str] = (),
+    timeout: Optional[float] = None,
+) -> None:
+    """
+    Pass each chunk, in order, to `buildkite-agent pipeline upload` on stdin.
+
+    Raises CalledProcessError if an upload fails, in which case the remaining chunks
+    are not uploaded.
+    """
+    for chunk in chunks:
+        subprocess.run(
+            [agent, "pipeline", "upload", *args],
+            input=chunk,
+            text=True,
+            check=True,
+            timeout=timeout,
+        )
@@ -1,31 +1,119 @@
-import os
+import contextlib
+import contextvars
+import functools
+import hashlib
 import re
-from typing import Any, Iterable, Pattern, TypeVar, Union, cast
+import threading
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+    TypeVar,
+    Union,
+    cast,
+)
 
 RE_NONID = re.compile(r"[^a-zA-Z0-9_]")
 RE_MULTI_US = re.compile(r"__+")
+RE_GLOB_SPECIAL = re.compile(r"[*?\[{]")
 T = TypeVar("T")
 ST = TypeVar("ST")
 
-KEY_COUNT = {}
+KEY_COUNT: Dict[str, int] = {}
 
 
-def generate_key(name: str) -> str:
+class KeyRegistry:
     """
-    Given a display name, generate a global unique value suitable
-    for use as a step key in Buildkite.
+    Tracks the step keys generated within a scope, so that generated keys are unique.
+
+    By default a counter suffix is appended to repeated names (`test`, `test__kf__1`,
+    ...), so keys depend on the order in which steps are created. With stable=True,
+    each key instead carries a short hash of the name and the identity of the step
+    (its class and command), so the same step gets the same key regardless of what
+    else was created, and repeated generations produce identical output.
+
+    Registries are safe to share between threads.
+    """
+
+    def __init__(self, stable: bool = False, counts: Optional[Dict[str, int]] = None):
+        self.stable = stable
+        self.counts: Dict[str, int] = {} if counts is None else counts
+        self._lock = threading.Lock()
+
+    def generate(self, name: str, *identity: str) -> str:
+        if not name:
+            return ""
+        norm = normalize_key(name)
+        if self.stable:
+            source = "\0".join((name,) + identity).encode("utf8")
+            norm = f"{norm}__{hashlib.sha1(source).hexdigest()[:8]}"
+        with self._lock:
+            count = self.counts.get(norm, 0)
+            self.counts[norm] = count + 1
+        if not count:
+            return norm
+        if self.stable:
+            return f"{norm}__{count + 1}"
+        return f"{norm}__kf__{count}"
+
+    def clear(self) -> None:
+        with self._lock:
+            self.counts.clear()
+
+
+# The default registry is process-wide, and shares its counts with KEY_COUNT
+_default_registry = KeyRegistry(counts=KEY_COUNT)
+_registry: contextvars.ContextVar[KeyRegistry] = contextvars.ContextVar(
+    "kitefly_key_registry", default=_default_registry
+)
+
+
+def current_key_registry() -> KeyRegistry:
+    return _registry.get()
+
+
+@contextlib.contextmanager
+def key_scope(
+    registry: Optional[KeyRegistry] = None, *, stable: bool = False
+) -> Iterator[KeyRegistry]:
+    """
+    Generate keys for steps created within the block from a separate registry, e.g.
+    one per pipeline. The scope is local to the current thread (or asyncio task).
+
+    Example:
+
+        with key_scope(stable=True):
+            pipeline = build_pipeline()
+    """
+    registry = registry or KeyRegistry(stable=stable)
+    token = _registry.set(registry)
+    try:
+        yield registry
+    finally:
+        _registry.reset(token)
+
+
+def generate_key(name: str, *identity: str) -> str:
+    """
+    Given a display name, generate a unique value suitable for use as a step key
+    in Buildkite, using the current key registry (see key_scope). The identity of
+    the step (e.g. its class and command) is used to derive stable keys.
+    """
+    return _registry.get().generate(name, *identity)
+
+
+def normalize_key(name: str) -> str:
+    """
+    Convert a display name to the characters allowed in a step key.
     """
-    if not name:
-        return ""
     norm = name.lower()
     for regex in (RE_NONID, RE_MULTI_US):
         norm = regex.sub("_", norm)
-    if norm not in KEY_COUNT:
-        KEY_COUNT[norm] = 1
-        return norm
-    suffix = f"__kf__{KEY_COUNT[norm]}"
-    KEY_COUNT[norm] += 1
-    return f"{norm}{suffix}"
+    return norm
 
 
 def is_iterable(v: Any) -> bool:
@@ -52,14 +140,157 @@ def as_iterable(v: Union[T, Iterable[T]]) -> Iterable[T]:
 def glob(pattern: str) -> Pattern:
     """
     Return a compiled regular expression that will match full filepaths
-    using the provided glob pattern.
-    """
-    escaped = re.escape(pattern)
-    globkey = "__:GLOB:__"
-    pattern = (
-        escaped.replace("\\*\\*/", globkey)
-        .replace("\\*\\*", globkey)
-        .replace("\\*", f"[^{os.sep}]*")
-        .replace(globkey, ".*")
-    )
-    return re.compile(pattern)
+    using the provided glob pattern, when used with fullmatch().
+
+    Supported syntax: `**` (any characters, including "/"), `**/` (zero or more
+    directories), `*` and `?` (any characters / one character within a path
+    segment), `[abc]`, `[!abc]` and `{a,b}`. A pattern without wildcards names a
+    file or directory, and also matches every path beneath it.
+    """
+    regex = _translate_glob(pattern)
+    if not RE_GLOB_SPECIAL.search(pattern):
+        regex += ".*" if pattern.endswith("/") else "(?:/.*)?"
+    return re.compile(regex)
+
+
+def _translate_glob(pattern: str) -> str:
+    regex = ""
+    i = 0
+    n = len(pattern)
+    while i < n:
+        char = pattern[i]
+        if pattern.startswith("**", i):
+            i += 2
+            if pattern.startswith("/", i):
+                i += 1
+                # '**/*' is equivalent to '.*[^/]*', so retain the shorter form
+                regex += ".*" if pattern.startswith("*", i) else "(?:.*/)?"
+            else:
+                regex += ".*"
+            continue
+        if char == "*":
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            body = pattern[i + 1:end]
+            if body.startswith("!"):
+                body = "^/" + body[1:]
+            regex += "[" + body.replace("\\", "\\\\") + "]"
+            i = end
+        elif char == "{" and "}" in pattern[i:]:
+            end = _closing_brace(pattern, i)
+            if end < 0:
+                regex += re.escape(char)
+            else:
+                options = _split_options(pattern[i + 1:end])
+                regex += "(?:" + "|".join(_translate_glob(o) for o in options) + ")"
+                i = end
+        else:
+            regex += re.escape(char)
+        i += 1
+    return regex
+
+
+def _closing_brace(pattern: str, start: int) -> int:
+    depth = 0
+    for i in range(start, len(pattern)):
+        if pattern[i] == "{":
+            depth += 1
+        elif pattern[i] == "}":
+            depth -= 1
+            if not depth:
+                return i
+    return -1
+
+
+def _split_options(body: str) -> List[str]:
+    options = []
+    depth = 0
+    current = ""
+    for char in body:
+        if char == "," and not depth:
+            options.append(current)
+            current = ""
+            continue
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+        current += char
+    options.append(current)
+    return options
+
+
+class Glob:
+    """
+    A compiled glob pattern, classified so that common patterns are matched with
+    plain string operations rather than a regular expression:
+
+    - EXACT: no wildcards (e.g. `src/lib`), matching the path itself or, when it
+      names a directory, any path beneath it
+    - PREFIX: a directory followed by `**` (e.g. `docs/**`), matching any path
+      beneath the directory
+    - SUFFIX: `**/*` followed by a literal (e.g. `**/*.py`), matching paths ending
+      in the literal
+    - REGEX: any other glob
+
+    A leading `!` negates the pattern; `negated` is set, and the remainder of the
+    pattern is compiled and matched as usual.
+    """
+
+    EXACT = "exact"
+    PREFIX = "prefix"
+    SUFFIX = "suffix"
+    REGEX = "regex"
+
+    def __init__(self, source: str):
+        self.source = source
+        self.negated = source.startswith("!")
+        pattern = source[1:] if self.negated else source
+        self.regex = glob(pattern)
+        self.kind = Glob.REGEX
+        self.value = ""
+        # The literal text every matching path starts with
+        special = RE_GLOB_SPECIAL.search(pattern)
+        self.literal_prefix = pattern[: special.start()] if special else pattern
+        if not RE_GLOB_SPECIAL.search(pattern):
+            self.kind = Glob.EXACT
+            self.value = pattern.rstrip("/")
+            if pattern.endswith("/"):
+                self.kind = Glob.PREFIX
+                self.value += "/"
+        elif pattern.endswith("**") and not RE_GLOB_SPECIAL.search(pattern[:-2]):
+            if not pattern[:-2] or pattern[:-2].endswith("/"):
+                self.kind = Glob.PREFIX
+                self.value = pattern[:-2]
+        elif pattern.startswith("**/*"):
+            suffix = pattern[4:]
+            if "/" not in suffix and not RE_GLOB_SPECIAL.search(suffix):
+                self.kind = Glob.SUFFIX
+                self.value = suffix
+
+    def matches(self, filepath: str) -> bool:
+        """
+        Return True if the filepath matches the pattern (ignoring negation).
+        """
+        if self.kind == Glob.EXACT:
+            return filepath == self.value or filepath.startswith(self.value + "/")
+        if self.kind == Glob.PREFIX:
+            return filepath.startswith(self.value)
+        if self.kind == Glob.SUFFIX:
+            return filepath.endswith(self.value)
+        return self.regex.fullmatch(filepath) is not None
+
+    def __repr__(self) -> str:
+        return f"Glob({self.source!r}, kind={self.kind})"
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_glob(pattern: str) -> Glob:
+    """
+    Return the compiled Glob for the pattern. Compiled globs are immutable, and
+    are shared between all callers through a bounded cache.
+    """
+    return Glob(pattern)
@@ -0,0 +1,102 @@
+import os
+
+from kitefly import Command, DiskChangedFilesCache, GitFilter, Pipeline, Target
+from kitefly.filter.git_refs import find_git_dir, resolve_ref
+
+from test_git_filter import GitMocked
+
+BASE_SHA = "1" * 40
+HEAD_SHA = "2" * 40
+
+
+def make_repo(root):
+    git_dir = root / ".git"
+    (git_dir / "refs" / "heads").mkdir(parents=True)
+    (git_dir / "HEAD").write_text("ref: refs/heads/feature\n")
+    (git_dir / "refs" / "heads" / "feature").write_text(HEAD_SHA + "\n")
+    (git_dir / "packed-refs").write_text(
+        "# pack-refs with: peeled fully-peeled sorted\n"
+        f"{BASE_SHA} refs/remotes/origin/main\n"
+        f"{'3' * 40} refs/tags/v1\n"
+        f"^{'4' * 40}\n"
+    )
+    (root / "src").mkdir()
+    return str(git_dir)
+
+
+def test_resolve_refs(tmp_path):
+    git_dir = make_repo(tmp_path)
+    assert find_git_dir(str(tmp_path / "src")) == git_dir
+    assert resolve_ref(git_dir, "HEAD") == HEAD_SHA
+    assert resolve_ref(git_dir, "feature") == HEAD_SHA
+    assert resolve_ref(git_dir, "origin/main") == BASE_SHA
+    assert resolve_ref(git_dir, "v1") == "3" * 40
+    assert resolve_ref(git_dir, "HEAD~1") is None
+
+
+def test_disk_cache_eviction(tmp_path):
+    cache = DiskChangedFilesCache(str(tmp_path / "cache"), max_entries=2)
+    assert cache.get("a", "b") is None
+    cache.put("a", "b", ["x.py", "dir/y z.md"])
+    assert cache.get("a", "b") == ["x.py", "dir/y z.md"]
+    cache.put("c", "d", [])
+    os.utime(cache._path("a", "b"), (0, 0))
+    cache.put("e", "f", ["z"])
+    assert cache.get("a", "b") is None
+    assert cache.get("c", "d") == []
+    assert cache.get("e", "f") == ["z"]
+
+
+def test_disk_cache_entry_evicted_while_read(tmp_path, monkeypatch):
+    cache = DiskChangedFilesCache(str(tmp_path / "cache"))
+    cache.put("a", "b", ["x.py"])
+
+    def evicted(path, *args):
+        os.remove(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, "utime", evicted)
+    assert cache.get("a", "b") == ["x.py"]
+
+
+def test_git_filter_uses_cache(tmp_path, monkeypatch):
+    git_dir = make_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    step = Command("Python", "py.sh", targets=[Target("**/*.py")])
+
+    with GitMocked(["src/app.py"]) as git:
+        gf = GitFilter("origin/main", cache=DiskChangedFilesCache())
+        assert len(Pipeline([step]).filtered(gf).steps) == 1
+        assert git.commands
+    assert os.listdir(os.path.join(git_dir, "kitefly", "changed-files")) == [
+        f"{BASE_SHA}-{HEAD_SHA}"
+    ]
+
+    with GitMocked(["src/app.py"]) as git:
+        gf = GitFilter("origin/main", cache=DiskChangedFilesCache())
+        assert len(Pipeline([step]).filtered(gf).steps) == 1
+        assert git.commands == []
+
+
+def test_git_filter_caches_under_fetched_commits(tmp_path, monkeypatch):
+    git_dir = make_repo(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    fetched_sha = "5" * 40
+
+    class FetchMovesBase(GitMocked):
+        def _check_call(self, cmd, *args, **kwargs):
+            if cmd[1] == "fetch":
+                (tmp_path / ".git" / "packed-refs").write_text(
+                    f"{fetched_sha} refs/remotes/origin/main\n"
+                )
+            return super()._check_call(cmd, *args, **kwargs)
+
+    cache = DiskChangedFilesCache()
+    with FetchMovesBase(["src/app.py"]):
+        assert GitFilter("origin/main", cache=cache).changed_files() == ["src/app.py"]
+    # the diff is stored under the fetched base commit, not the stale one
+    assert cache.get(BASE_SHA, HEAD_SHA) is None
+    assert cache.get(fetched_sha, HEAD_SHA) == ["src/app.py"]
+    assert os.listdir(os.path.join(git_dir, "kitefly", "changed-files")) == [
+        f"{fetched_sha}-{HEAD_SHA}"
+    ]
@@ -0,0 +1,72 @@
+import pytest
+
+from kitefly import And, Command, CompositeFilter, Group, NoopFilter, Not, Or, Pipeline
+from kitefly.filter.filter import Filter
+
+
+class KeyFilter(Filter):
+    def __init__(self, *keys: str, cost: float = 1.0):
+        self.keys = keys
+        self.cost = cost
+        self.calls = 0
+        self.prepared = 0
+
+    def prepare(self, steps) -> None:
+        self.prepared += 1
+
+    def __call__(self, step) -> bool:
+        self.calls += 1
+        return step.key in self.keys
+
+
+def test_operators():
+    a, b, c = KeyFilter("a"), KeyFilter("b"), KeyFilter("c")
+    combined = a & b & c
+    assert isinstance(combined, And)
+    assert combined.filters == [a, b, c]
+    assert isinstance(a | b, Or)
+    assert isinstance(~a, Not)
+    assert (~a).cost == a.cost
+    assert (a | b).cost == 2.0
+    with pytest.raises(TypeError):
+        CompositeFilter(a, b)
+
+
+def test_cheapest_first_and_short_circuit():
+    expensive = KeyFilter("a", "b", cost=100)
+    cheap = KeyFilter("a", cost=0.5)
+    steps = [Command(name, f"{name}.sh") for name in "abc"]
+    f = And(expensive, cheap)
+    assert f.filters == [cheap, expensive]
+    assert [s.key for s in steps if f(s)] == ["a"]
+    # the expensive filter only sees steps the cheap filter included
+    assert (cheap.calls, expensive.calls) == (3, 1)
+
+    expensive.calls = cheap.calls = 0
+    f = Or(expensive, cheap)
+    assert [s.key for s in steps if f(s)] == ["a", "b"]
+    assert (cheap.calls, expensive.calls) == (3, 2)
+
+
+def test_memoized_verdicts():
+    inner = KeyFilter("a")
+    build = Command("a", "a.sh")
+    f = Or(~inner, NoopFilter()) & inner
+    assert f(build) and f(build)
+    assert inner.calls == 1
+    # verdicts are reset when the filter is prepared again
+    f.prepare([build])
+    assert inner.prepared == 2
+    assert f(build)
+    assert inner.calls == 2
+
+
+def test_pipeline_filtered():
+    force = KeyFilter("deploy", cost=0)
+    tags = KeyFilter("build", "test", "lint")
+    git = KeyFilter("build", "deploy", cost=50)
+    steps = [Command(name, f"{name}.sh") for name in ("build", "test", "deploy")]
+    pipeline = Pipeline([Group(steps[:2], label="G"), steps[2], Command("lint", "l.sh")])
+    filtered = pipeline.filtered(force | (tags & git))
+    assert [s["key"] for s in filtered.asdict()["steps"]] == ["g__kf__1", "deploy"]
+    assert [s["key"] for s in filtered.asdict()["steps"][0]["steps"]] == ["build"]
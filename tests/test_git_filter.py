@@ -1,30 +1,39 @@
+import io
 import os
+import subprocess
 
-from kitefly import GitFilter, Command, Target, Pipeline
+import pytest
+
+from kitefly import GitFilter, Command, Group, Target, Pipeline
 from kitefly.filter.filter import Filter
 import kitefly.filter.git_filter
+from kitefly.filter.git_filter import _read_nul_separated, _split_records
 
 
 class GitMocked:
     def __init__(self, file_list: list[str]):
         self.file_list = file_list
-        self._orig_check_call = None
-        self._orig_check_output = None
+        self.commands: list[list[str]] = []
+        self._originals: dict = {}
 
     def __enter__(self):
-        self.orig_check_call = kitefly.filter.git_filter.check_call
-        self.orig_check_output = kitefly.filter.git_filter.check_output
+        for name in ("check_call", "check_output", "Popen"):
+            self._originals[name] = getattr(kitefly.filter.git_filter, name)
         kitefly.filter.git_filter.check_call = self._check_call
         kitefly.filter.git_filter.check_output = self._check_output
+        kitefly.filter.git_filter.Popen = self._popen
+        return self
 
     def __exit__(self, _1, _2, _3):
-        kitefly.filter.git_filter.check_call = self._orig_check_call
-        kitefly.filter.git_filter.check_output = self._orig_check_output
+        for name, value in self._originals.items():
+            setattr(kitefly.filter.git_filter, name, value)
 
-    def _check_call(self, *args, **kwargs):
+    def _check_call(self, cmd, *args, **kwargs):
+        self.commands.append(cmd)
         return True
 
     def _check_output(self, cmd, *args, **kwargs):
+        self.commands.append(cmd)
         if len(cmd) < 2:
             return ""
         if cmd[1] == "rev-parse":
@@ -32,6 +41,22 @@ class GitMocked:
         elif cmd[1] == "diff":
             return "\n".join(self.file_list) + "\n"
 
+    def _popen(self, cmd, *args, **kwargs):
+        self.commands.append(cmd)
+        return PopenMocked("\0".join(self.file_list).encode("utf8") + b"\0")
+
+
+class PopenMocked:
+    def __init__(self, output: bytes, returncode: int = 0):
+        self.stdout = io.BytesIO(output)
+        self.returncode = returncode
+
+    def wait(self):
+        return self.returncode
+
+    def kill(self):
+        pass
+
 
 def test_git_filter():
     with GitMocked(["README.md", "app/file.py"]):
@@ -46,6 +71,119 @@ def test_git_filter():
         assert len(steps) == 2
 
 
+def test_git_filter_target_dependencies():
+    with GitMocked(["lib/util.py"]):
+        lib = Target.src("lib")
+        app = Target.src("app")
+        app >> lib
+        c1 = Command("App tests", "app.sh", targets=[app])
+        c2 = Command("Docs", "docs.sh", targets=[Target("**/*.md")])
+        steps = Pipeline([c1, c2]).filtered(GitFilter(base_branch="main")).steps
+        assert [s.key for s in steps] == ["app_tests"]
+
+
+def test_git_filter_highest_priority_target():
+    with GitMocked(["app/main.py", "app/README.md", "tools/x.py"]):
+        app = Target("app/**", name="app").prio(5)
+        py = Target("**/*.py", name="py")
+        docs = Target("**/*.md", name="docs").prio(10)
+        steps = [
+            Command("App", "app.sh", targets=[app]),
+            Command("Python", "py.sh", targets=[py]),
+            Command("Docs", "docs.sh", targets=[docs]),
+        ]
+        gf = GitFilter(base_branch="main")
+        assert [s.key for s in Pipeline(steps).filtered(gf).steps] == [
+            "app",
+            "python",
+            "docs",
+        ]
+        assert gf.explain().splitlines() == [
+            "app/README.md -> docs [r/.*[^/]*\\.md/]",
+            "app/main.py -> app [r/app/.*/]",
+            "tools/x.py -> py [r/.*[^/]*\\.py/]",
+        ]
+
+    with GitMocked(["app/main.py"]):
+        gf = GitFilter(base_branch="main")
+        assert [s.key for s in Pipeline(steps).filtered(gf).steps] == ["app"]
+        gf = GitFilter(base_branch="main", exclusive=False)
+        assert [s.key for s in Pipeline(steps).filtered(gf).steps] == ["app", "python"]
+
+
+def test_git_filter_match_cache():
+    with GitMocked(["app/main.py"]) as git:
+        app = Target("app/**")
+        lib = Target("lib/**")
+        app_tests = Command("App tests", "app.sh", targets=[app])
+        e2e_tests = Command("E2E tests", "e2e.sh", targets=[app])
+        lib_tests = Command("Lib tests", "lib.sh", targets=[lib])
+        gf = GitFilter(base_branch="main")
+        pipeline = Pipeline([Group([app_tests, lib_tests]), e2e_tests])
+        filtered = pipeline.filtered(gf)
+        assert gf.match_cache == {app: True, lib: False}
+        assert gf.cache_stats == {"hits": 1, "misses": 2, "targets": 2}
+
+        Group([app_tests, e2e_tests, lib_tests]).filtered(gf)
+        assert gf.cache_stats == {"hits": 4, "misses": 2, "targets": 2}
+        assert sum(1 for cmd in git.commands if cmd[1] == "diff") == 1
+
+        # New targets may be added as long as they don't change given verdicts
+        docs = Target("docs/**")
+        Group([Command("Docs", "docs.sh", targets=[docs])]).filtered(gf)
+        assert gf.match_cache == {app: True, lib: False, docs: False}
+
+        # but a target taking ownership of a file from a filtered one is rejected
+        main = Target("app/main.py")
+        with pytest.raises(ValueError):
+            Group([Command("Main", "main.sh", targets=[main])]).filtered(gf)
+        assert gf.target_matches(app) is True
+        assert main not in gf.target_set
+
+        # whereas each pipeline is filtered afresh
+        main_tests = Command("Main tests", "main.sh", targets=[main])
+        steps = Pipeline([app_tests, main_tests]).filtered(gf).steps
+        assert [s.key for s in steps] == ["main_tests"]
+        assert gf.match_cache == {app: False, main: True}
+        assert [s.key for s in Pipeline([app_tests]).filtered(gf).steps] == ["app_tests"]
+        assert sum(1 for cmd in git.commands if cmd[1] == "diff") == 1
+
+
+def test_git_filter_prefetch_options():
+    with GitMocked([".github/workflows/test.yml", "lib/util.py"]) as git:
+        gf = GitFilter(
+            base_branch="main",
+            prefetch=True,
+            fetch="never",
+            timeout=5,
+        )
+        c1 = Command("CI config", "ci.sh", targets=[Target(".github/**")])
+        steps = Pipeline([c1]).filtered(gf).steps
+        assert [s.key for s in steps] == ["ci_config"]
+        assert ["git", "diff", "-z", "--name-only", "main"] in git.commands
+        assert not any(cmd[1] == "fetch" for cmd in git.commands)
+
+    with GitMocked([]) as git:
+        gf = GitFilter(base_branch="main", fetch_depth=1, fetch_filter="blob:none")
+        assert gf._files_changed_since_branch("main") == []
+        assert ["git", "fetch", "--depth=1", "--filter=blob:none", "origin", "main"] in git.commands
+
+    with pytest.raises(ValueError):
+        GitFilter(base_branch="main", fetch="sometimes")
+
+
+def test_split_records():
+    stream = io.BytesIO(b"a.py\0dir/b c.txt\0\0last")
+    assert list(_split_records(stream, chunk_size=3)) == ["a.py", "dir/b c.txt", "last"]
+
+
+def test_read_nul_separated_timeout():
+    with pytest.raises(subprocess.TimeoutExpired):
+        list(_read_nul_separated(["sleep", "5"], os.getcwd(), 0.1))
+    with pytest.raises(subprocess.CalledProcessError):
+        list(_read_nul_separated(["false"], os.getcwd(), None))
+
+
 def test_base_filter():
     f = Filter()
     assert f(None) == False
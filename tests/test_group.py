@@ -35,3 +35,20 @@ def test_group_addition():
     g3 = g1 + g2
     g4 = g3 + c3
     assert [s.key for s in g4.steps] == ["c1", "c2", "c3"]
+
+
+def test_flattened_steps_cache():
+    a, b, c, d = (Command(name, f"{name}.sh") for name in "abcd")
+    inner = Group([b], label="Inner")
+    outer = Group([a, inner], label="Outer")
+    assert outer.steps == [a, b]
+    assert outer.steps is not outer.steps
+    assert list(outer.iter_steps()) == [a, b]
+    # changes to nested groups invalidate the flattened steps
+    inner += c
+    assert outer.steps == [a, b, c]
+    outer += Group([d])
+    assert outer.size == 4
+    assert list(outer.iter_steps()) == [a, b, c, d]
+    assert (outer + a).steps == [a, b, c, d, a]
+    assert outer.size == 4
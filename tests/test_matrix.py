@@ -0,0 +1,97 @@
+import pytest
+
+from kitefly import Command, Group, Matrix, Pipeline, Plugin, Target
+from kitefly.filter.filter import Filter
+
+
+class TargetFilter(Filter):
+    def __init__(self, *targets: Target):
+        self.targets = targets
+        self.calls = 0
+
+    def __call__(self, step) -> bool:
+        self.calls += 1
+        return any(t in self.targets for t in step.get_targets())
+
+
+def test_matrix_elements():
+    class Linux(Command):
+        env = {"OS": "linux"}
+
+    matrix = Linux.matrix(
+        "Test {{matrix.py}} shard {{matrix.shard}}",
+        "pytest --shard {{matrix.shard}}",
+        axes={"py": ["3.10", "3.11"], "shard": range(2)},
+        env={"SHARD": "{{matrix.shard}}"},
+        plugins=[Plugin("docker", {"image": "python:{{matrix.py}}"})],
+    )
+    assert isinstance(matrix, Matrix)
+    assert matrix.size == 4
+    d = matrix.asdict()
+    assert d["group"] == "Test shard"
+    assert d["key"] == "test_shard"
+    steps = d["steps"]
+    assert [s["key"] for s in steps] == [
+        "test_shard__3_10__0",
+        "test_shard__3_10__1",
+        "test_shard__3_11__0",
+        "test_shard__3_11__1",
+    ]
+    assert steps[3]["label"] == "Test 3.11 shard 1"
+    assert steps[3]["command"] == "pytest --shard 1"
+    assert steps[3]["env"] == {"OS": "linux", "SHARD": "1"}
+    assert steps[3]["plugins"] == {"docker": {"image": "python:3.11"}}
+    # elements never share containers, which would be rendered as YAML aliases
+    assert steps[0]["env"] is not steps[1]["env"]
+    assert "&id" not in Pipeline([matrix]).asyaml()
+
+
+def test_matrix_labels_and_errors():
+    matrix = Command.matrix("Lint", "lint.sh {{matrix}}", axes={"dir": ["a", "b"]})
+    assert [s["label"] for s in matrix.element_dicts()] == ["Lint (a)", "Lint (b)"]
+    with pytest.raises(ValueError):
+        Command.matrix("Lint", "lint.sh {{matrix.missing}}", axes={"dir": ["a"]})
+    with pytest.raises(ValueError):
+        Command.matrix("Lint", "lint.sh {{matrix}}", axes={"a": [1], "b": [2]})
+    with pytest.raises(ValueError):
+        Group([matrix])
+
+
+def test_matrix_in_pipeline():
+    target = Target("src/")
+    build = Command("Build", "build.sh")
+    matrix = Command.matrix(
+        "Test", "test.sh {{matrix}}", axes={"shard": range(1000)}, targets=[target]
+    )
+    deploy = Command("Deploy", "deploy.sh")
+    matrix >> build
+    deploy >> matrix
+
+    steps = Pipeline([build, matrix]).asdict()["steps"]
+    assert [s["key"] for s in steps] == ["build", "test", "deploy"]
+    assert steps[1]["depends_on"] == ["build"]
+    assert len(steps[1]["steps"]) == 1000
+    assert "depends_on" not in steps[1]["steps"][0]
+    assert steps[2]["depends_on"] == ["test"]
+
+    # the whole matrix is filtered by its template
+    docs_target = Target("docs/")
+    docs = Command("Docs", "docs.sh", targets=[docs_target])
+    f = TargetFilter(docs_target)
+    pipeline = Pipeline([docs, matrix]).filtered(f)
+    assert f.calls == 2
+    assert [s.key for s in pipeline.steps] == ["docs"]
+    f = TargetFilter(target)
+    assert [s.key for s in Pipeline([docs, matrix]).filtered(f).steps] == [
+        "test",
+        "deploy",
+    ]
+
+
+def test_empty_matrix_in_pipeline():
+    matrix = Command.matrix("Test", "test.sh {{matrix}}", axes={"shard": []})
+    deploy = Command("Deploy", "deploy.sh")
+    deploy >> matrix
+    steps = Pipeline([matrix]).asdict()["steps"]
+    # dependents don't refer to the empty matrix, which isn't uploaded
+    assert steps == [{"command": "deploy.sh", "key": "deploy", "label": "Deploy"}]
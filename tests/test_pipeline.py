@@ -0,0 +1,132 @@
+import io
+import json
+import threading
+
+from kitefly import Command, Group, NoopFilter, Pipeline, Wait, key_scope
+from kitefly.filter.filter import Filter
+
+
+class KeyFilter(Filter):
+    def __init__(self, *keys: str):
+        self.keys = keys
+
+    def __call__(self, step) -> bool:
+        return step.key in self.keys
+
+
+def test_steps_do_not_mutate_inputs():
+    build = Command("Build", "build.sh")
+    test = Command("Test", "test.sh")
+    deploy = Command("Deploy", "deploy.sh")
+    deploy >> [build, test]
+
+    pipeline = Pipeline([build, test]).filtered(KeyFilter("build"))
+    steps = pipeline.steps
+    assert [s.key for s in steps] == ["build", "deploy"]
+    assert steps[1].depends_on == ["build"]
+    assert steps[1] is not deploy
+    assert deploy.depends_on == ["build", "test"]
+    assert len(pipeline.items) == 1
+
+
+def test_steps_cached_until_changed():
+    build = Command("Build", "build.sh")
+    group = Group([build], label="Build Phase")
+    pipeline = Pipeline([group, Wait()])
+    steps = pipeline.steps
+    assert pipeline.steps is steps
+
+    publish = Command("Publish", "publish.sh")
+    publish >> build
+    assert pipeline.steps is not steps
+    assert [s.key for s in pipeline.steps] == ["build_phase", "", "publish"]
+
+    steps = pipeline.steps
+    group += Command("Lint", "lint.sh")
+    assert pipeline.steps is not steps
+    assert len(pipeline.steps[0].steps) == 2
+
+
+def test_step_graph():
+    a = Command("A", "a.sh")
+    b = Command("B", "b.sh")
+    c = Command("C", "c.sh")
+    c >> b
+    b >> a
+    graph = Pipeline([c, b, a]).graph
+    assert graph.topological_order() == ["a", "b", "c"]
+    assert graph.dependents["a"] == ["b"]
+    assert graph.depends_on["c"] == ["b"]
+
+
+def test_empty_pipeline():
+    assert Pipeline([Wait(), Wait()]).steps == []
+    assert Pipeline([Group([])]).filtered(NoopFilter()).steps == []
+
+
+def test_render_formats():
+    build = Command("Build", "build.sh", env={"A": "1"})
+    test = Command("Test", "test.sh")
+    test >> build
+    pipeline = Pipeline([Group([build], label="Compile"), Wait(), test])
+
+    stream = io.StringIO()
+    pipeline.write_yaml(stream)
+    assert stream.getvalue() == pipeline.asyaml()
+    assert json.loads(pipeline.asjson()) == pipeline.asdict()
+
+    stream = io.StringIO()
+    Pipeline([]).write_yaml(stream)
+    assert stream.getvalue() == Pipeline([]).asyaml()
+
+
+def test_parallel_render_and_filter(monkeypatch):
+    items = []
+    for i in range(20):
+        build = Command(f"Build {i}", "build.sh", env={"N": str(i)})
+        items.append(Group([build, Command(f"Test {i}", "test.sh") >> build]))
+        items.append(Wait())
+    pipeline = Pipeline(items)
+    assert pipeline.asdict(workers=3) == pipeline.asdict()
+    assert pipeline.asyaml(workers=3) == pipeline.asyaml()
+
+    keys = ("build_3", "test_7", "build_12")
+    # filtered groups are copied with new keys, generated in the same order
+    with key_scope():
+        serial = Pipeline(items).filtered(KeyFilter(*keys)).asyaml()
+    with key_scope():
+        assert Pipeline(items).filtered(KeyFilter(*keys), workers=3).asyaml() == serial
+
+    # falls back to rendering serially when the pool can't be used
+    def broken(*args):
+        raise OSError("no processes")
+
+    monkeypatch.setattr("kitefly.parallel._map_in_pool", broken)
+    assert pipeline.asyaml(workers=3) == pipeline.asyaml()
+
+
+def test_parallel_render_with_running_threads(monkeypatch):
+    pools = []
+    monkeypatch.setattr("kitefly.parallel._map_in_pool", lambda *args: pools.append(args))
+    pipeline = Pipeline([Command(f"Build {i}", "build.sh") for i in range(10)])
+    expected = pipeline.asyaml()
+    done = threading.Event()
+    thread = threading.Thread(target=done.wait)
+    thread.start()
+    try:
+        assert pipeline.asyaml(workers=3) == expected
+        assert pools == []
+    finally:
+        done.set()
+        thread.join()
+
+
+def test_filtered_with_plain_callable():
+    build = Command("Build", "build.sh")
+    lint = Command("Lint", "lint.sh")
+    test = Command("Test", "test.sh")
+    pipeline = Pipeline([build, Group([lint, test])])
+    filtered = pipeline.filtered(lambda step: step.key != "lint")
+    assert filtered.steps[0].key == "build"
+    assert [s.key for s in filtered.steps[1].steps] == ["test"]
+    assert [s.key for s in Group([lint, test]).filtered(lambda s: s is lint).steps] == ["lint"]
@@ -0,0 +1,128 @@
+import io
+import json
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from kitefly.cli import answer_lines, format_steps, main
+from kitefly.query import PipelineQuery, load_pipeline
+from kitefly.unix_socket import request, serve
+
+DEFINITION = """
+from kitefly import Command, Pipeline, Target
+
+lib = Target("lib/**", name="lib")
+app = Target("app/**", name="app")
+app >> lib
+docs = Target("docs/**", name="docs")
+
+build = Command("Build", "make", key="build", targets=[app])
+test_lib = Command("Test lib", "make test", key="test-lib", targets=[lib])
+build << Command("Publish", "make publish", key="publish")
+docs_step = Command("Docs", "make docs", key="docs", targets=[docs])
+pipeline = Pipeline([build, test_lib, docs_step])
+
+if __name__ == "__main__":
+    print(pipeline.asyaml())
+"""
+
+
+def write_definition(tmp_path) -> str:
+    path = os.path.join(tmp_path, "pipeline.py")
+    with open(path, "w") as stream:
+        stream.write(DEFINITION)
+    return path
+
+
+def test_query(tmp_path, capsys):
+    query = PipelineQuery(load_pipeline(write_definition(tmp_path)))
+    assert capsys.readouterr().out == ""
+    steps = query.query(["lib/util.py"])
+    assert [s.key for s in steps] == ["build", "test-lib", "publish"]
+    assert [(m.path, m.target.name) for m in steps[0].matches] == [("lib/util.py", "lib")]
+    assert steps[2].matches == []
+    assert steps[2].dependent_of == ["build"]
+    assert [s.key for s in query.query(["app/main.py"])] == ["build", "publish"]
+    assert query.query(["README.md"]) == []
+    assert format_steps(query.query(["docs/index.md"])) == (
+        "docs  Docs\n    docs/index.md -> docs (docs/**)\n"
+    )
+
+
+def test_query_stdin(tmp_path):
+    query = PipelineQuery(load_pipeline(write_definition(tmp_path)))
+    output = io.StringIO()
+    answer_lines(query, io.StringIO('["docs/a.md"]\n\n{"paths": []}\n"oops"\n'), output)
+    responses = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert responses[0] == {
+        "steps": [
+            {
+                "key": "docs",
+                "label": "Docs",
+                "matches": [{"path": "docs/a.md", "target": "docs", "pattern": "docs/**"}],
+                "dependent_of": [],
+            }
+        ]
+    }
+    assert responses[1] == {"steps": []}
+    assert "error" in responses[2]
+
+
+def test_query_cli(tmp_path, capsys):
+    assert main(["query", write_definition(tmp_path), "app/x.py", "--json"]) == 0
+    result = json.loads(capsys.readouterr().out)
+    assert [s["key"] for s in result["steps"]] == ["build", "publish"]
+
+
+def test_query_socket(tmp_path):
+    query = PipelineQuery(load_pipeline(write_definition(tmp_path)))
+    path = os.path.join(tmp_path, "query.sock")
+    ready = threading.Event()
+    thread = threading.Thread(
+        target=serve,
+        args=(path, lambda paths: {"keys": [s.key for s in query.query(paths)]}, ready.set),
+        daemon=True,
+    )
+    thread.start()
+    assert ready.wait(5)
+    for _ in range(50):
+        if os.path.exists(path):
+            break
+        time.sleep(0.01)
+    assert request(path, ["lib/a.py"], timeout=5) == {"keys": ["build", "test-lib", "publish"]}
+    assert request(path, ["docs/a.md"], timeout=5) == {"keys": ["docs"]}
+
+
+def test_socket_path_checks(tmp_path):
+    regular = os.path.join(tmp_path, "pipeline.py")
+    with open(regular, "w") as stream:
+        stream.write("")
+    with pytest.raises(FileExistsError):
+        serve(regular, lambda message: {})
+    assert os.path.exists(regular)
+
+    path = os.path.join(tmp_path, "query.sock")
+    ready = threading.Event()
+    thread = threading.Thread(target=serve, args=(path, lambda m: {"ok": m}, ready.set))
+    thread.daemon = True
+    thread.start()
+    assert ready.wait(5)
+    with pytest.raises(FileExistsError):
+        serve(path, lambda message: {})
+    # the running server still answers
+    assert request(path, 1, timeout=5) == {"ok": 1}
+
+    # a socket left behind by a server which exited is replaced
+    stale = os.path.join(tmp_path, "stale.sock")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(stale)
+    listener.close()
+    thread = threading.Thread(target=serve, args=(stale, lambda m: {"ok": m}, ready.set))
+    ready.clear()
+    thread.daemon = True
+    thread.start()
+    assert ready.wait(5)
+    assert request(stale, 2, timeout=5) == {"ok": 2}
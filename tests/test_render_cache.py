@@ -0,0 +1,81 @@
+import os
+
+from kitefly import (
+    Command,
+    DiskRenderCache,
+    Group,
+    Pipeline,
+    RenderCache,
+    Wait,
+    key_scope,
+)
+from kitefly.render_cache import data_fingerprint
+
+
+def make_pipeline(timeout: int = 0) -> Pipeline:
+    # stable keys, so repeated generations are identical
+    with key_scope(stable=True):
+        build = Command("Build", "build.sh", env={"A": "1"})
+        test = Command("Test", "test.sh", timeout_in_minutes=timeout) >> build
+        return Pipeline([build, Wait(), Group([test, Command("Lint", "lint.sh")])])
+
+
+def test_data_fingerprint():
+    class Linux(Command):
+        env = {"OS": "linux"}
+
+    a = Command("Build", "build.sh", key="build")
+    b = Command("Build", "build.sh", key="build")
+    assert data_fingerprint(a.asdict()) == data_fingerprint(b.asdict())
+    # class defaults are part of the rendered data
+    linux = Linux("Build", "build.sh", key="build")
+    assert data_fingerprint(linux.asdict()) != data_fingerprint(a.asdict())
+    # lists and tuples are serialized differently
+    assert data_fingerprint({"a": [1]}) != data_fingerprint({"a": (1,)})
+    assert data_fingerprint({"a": lambda: 1}) is None
+
+
+def test_render_cache():
+    cache = RenderCache()
+    pipeline = make_pipeline()
+    expected = pipeline.asyaml()
+    assert pipeline.asyaml(cache=cache) == expected
+    assert (cache.hits, cache.misses, len(cache)) == (0, 3, 3)
+    assert make_pipeline().asyaml(cache=cache) == make_pipeline().asyaml()
+    assert (cache.hits, cache.misses) == (3, 3)
+    # only the changed group is rendered again
+    changed = make_pipeline(timeout=5)
+    assert changed.asyaml(cache=cache) == changed.asyaml()
+    assert (cache.hits, cache.misses) == (5, 4)
+
+
+def test_render_cache_eviction():
+    cache = RenderCache(max_entries=2)
+    make_pipeline().asyaml(cache=cache)
+    assert len(cache) == 2
+
+
+def test_disk_render_cache(tmp_path):
+    pipeline = make_pipeline()
+    expected = pipeline.asyaml()
+    assert pipeline.asyaml(cache=DiskRenderCache(str(tmp_path))) == expected
+    cache = DiskRenderCache(str(tmp_path), max_entries=4)
+    assert make_pipeline().asyaml(cache=cache) == expected
+    assert (cache.hits, cache.misses) == (3, 0)
+    make_pipeline(timeout=5).asyaml(cache=cache)
+    assert len(cache) == 4
+
+
+def test_disk_render_cache_entry_evicted_while_read(tmp_path, monkeypatch):
+    pipeline = make_pipeline()
+    expected = pipeline.asyaml()
+    pipeline.asyaml(cache=DiskRenderCache(str(tmp_path)))
+
+    def evicted(path, *args):
+        os.remove(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, "utime", evicted)
+    cache = DiskRenderCache(str(tmp_path))
+    assert make_pipeline().asyaml(cache=cache) == expected
+    assert cache.hits == 3
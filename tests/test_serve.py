@@ -0,0 +1,128 @@
+import os
+import sys
+import threading
+
+import pytest
+
+from kitefly.cli import main
+from kitefly.query import load_pipeline
+from kitefly.serve import CheckoutMismatch, PipelineServer
+from kitefly.unix_socket import request, serve
+
+from test_git_filter import GitMocked
+
+TARGETS = """
+from kitefly import Target
+
+app = Target("app/**", name="app")
+"""
+
+DEFINITION = """
+from kitefly import Command, Group, Pipeline
+from serve_targets import app
+
+pipeline = Pipeline([
+    Command("Build", "make", targets=[app]),
+    Group([Command("Test", "make test"), Command("Lint", "make lint")]),
+])
+"""
+
+
+@pytest.fixture
+def definition(tmp_path):
+    with open(tmp_path / "serve_targets.py", "w") as stream:
+        stream.write(TARGETS)
+    path = str(tmp_path / "pipeline.py")
+    with open(path, "w") as stream:
+        stream.write(DEFINITION)
+    yield path
+    sys.modules.pop("serve_targets", None)
+
+
+def test_render(definition):
+    server = PipelineServer(definition)
+    output = server.render()
+    assert output == load_pipeline(definition).asyaml()
+    assert server.render() == output
+    assert server.loads == 1
+    assert server.cache.hits == 2
+    assert sorted(os.path.basename(p) for p in server.watched) == [
+        "pipeline.py",
+        "serve_targets.py",
+    ]
+    assert '"command": "make"' in server.render(format="json")
+    with pytest.raises(ValueError):
+        server.render(format="xml")
+
+
+def test_reload(definition, tmp_path):
+    server = PipelineServer(definition)
+    server.render()
+    # unchanged contents are not reloaded, even if the file was touched
+    os.utime(definition, ns=(0, 0))
+    server.render()
+    assert server.loads == 1
+    with open(definition, "a") as stream:
+        stream.write("pipeline.items.append(Command('Deploy', 'make deploy'))\n")
+    assert "make deploy" in server.render()
+    assert server.loads == 2
+    with open(tmp_path / "serve_targets.py", "a") as stream:
+        stream.write("app.name = 'application'\n")
+    server.render()
+    assert server.loads == 3
+    assert server.pipeline.items[0].get_targets()[0].name == "application"
+
+
+def test_handle(definition):
+    server = PipelineServer(definition)
+    assert server.handle({"command": "render"}) == {"output": server.render()}
+    status = server.handle({"command": "status"})
+    assert status["loads"] == 1
+    assert status["renders"] == 2
+    with pytest.raises(ValueError):
+        server.handle({"command": "restart"})
+
+
+def test_render_cli(definition, tmp_path, capsys):
+    expected = load_pipeline(definition).asyaml()
+    socket_path = str(tmp_path / "kitefly.sock")
+    # Without a server, the definition is rendered in-process
+    assert main(["render", "--socket", socket_path, definition, "--base-branch", ""]) == 0
+    assert capsys.readouterr().out == expected
+
+    server = PipelineServer(definition)
+    ready = threading.Event()
+    thread = threading.Thread(target=serve, args=(socket_path, server.handle, ready.set))
+    thread.daemon = True
+    thread.start()
+    assert ready.wait(5)
+    assert main(["render", "--socket", socket_path, "--base-branch", ""]) == 0
+    assert capsys.readouterr().out == expected
+    assert request(socket_path, {"command": "status"}, timeout=5)["renders"] == 1
+    assert "error" in request(socket_path, {"command": "restart"}, timeout=5)
+
+
+def test_render_in_client_checkout(definition, tmp_path):
+    checkout = str(tmp_path / "checkout")
+    os.mkdir(checkout)
+    directories = []
+
+    class RecordingGit(GitMocked):
+        def _check_output(self, cmd, *args, **kwargs):
+            directories.append(kwargs.get("cwd"))
+            return super()._check_output(cmd, *args, **kwargs)
+
+    server = PipelineServer(definition)
+    with RecordingGit(["app/main.py"]):
+        output = server.render("main", cwd=checkout)
+    assert directories and set(directories) == {checkout}
+    assert "make test" not in output
+
+    with pytest.raises(CheckoutMismatch):
+        server.render(cwd=str(tmp_path / "missing"))
+    # tmp_path isn't a git checkout, so its HEAD can't match
+    response = server.handle({"command": "render", "cwd": checkout, "head": "1" * 40})
+    assert response["mismatch"] is True
+    response = server.handle({"command": "render", "definition": str(tmp_path / "other.py")})
+    assert response["mismatch"] is True
+    assert server.handle({"command": "render", "definition": definition})["output"]
@@ -1,4 +1,4 @@
-from kitefly import Step, Command, Target
+from kitefly import AutomaticRetry, Step, Command, Plugin, Target, Wait
 
 
 def test_tags():
@@ -22,7 +22,32 @@ def test_targets():
     for t in c.get_targets():
         for p in t.patterns:
             patterns.append(str(p))
-    assert patterns == ["r/.*[^/]*\\.py/", "r/.*test\\-data\\.json/"]
+    assert patterns == ["r/.*[^/]*\\.py/", "r/(?:.*/)?test\\-data\\.json/"]
+
+
+def test_inherited_class_defaults():
+    class Linux(Command):
+        env = {"OS": "linux"}
+        agents = {"os": "linux"}
+        timeout_in_minutes = 10
+
+    class LinuxHighCpu(Linux):
+        agents = {"instance": "large"}
+        artifact_paths = ["out/**"]
+
+    c1 = LinuxHighCpu("Build", "build.sh", env={"A": "1"})
+    c2 = LinuxHighCpu("Test", "test.sh", timeout_in_minutes=5)
+    d1, d2 = c1.asdict(), c2.asdict()
+    assert d1["env"] == {"OS": "linux", "A": "1"}
+    assert d2["env"] == {"OS": "linux"}
+    assert d1["agents"] == {"os": "linux", "instance": "large"}
+    assert d1["timeout_in_minutes"] == 10
+    assert d2["timeout_in_minutes"] == 5
+    assert d1["artifact_paths"] == ["out/**"]
+    assert Linux("Lint", "lint.sh").asdict()["agents"] == {"os": "linux"}
+    # class defaults are resolved once per class and never shared with output
+    assert LinuxHighCpu._inherited() is LinuxHighCpu._inherited()
+    assert d2["env"] is not LinuxHighCpu._inherited().env
 
 
 def test_attrs():
@@ -59,6 +84,23 @@ def test_equality():
     assert c1 != "foobar"
 
 
+def test_structural_equality():
+    c1 = Command("Run command", "command.sh", key="cmd")
+    c2 = Command("Run command", "command.sh", key="cmd")
+    c3 = Command("Run command", "other.sh", key="cmd")
+    assert c1 == c2 and hash(c1) == hash(c2)
+    assert c1.same_as(c2)
+    assert not c1.same_as(c3)
+    assert Wait() != Wait()
+    assert Wait().same_as(Wait())
+    assert not Wait().same_as(Wait(continue_on_failure=True))
+
+    fingerprint = c1.fingerprint()
+    c1 >> Command("Dependency", "dep.sh")
+    assert c1.fingerprint() != fingerprint
+    assert not c1.same_as(c2)
+
+
 def test_invalid_deps():
     c1 = Command("Run command", "command.sh", priority=5)
     c2 = Command(label="", command="command.sh")
@@ -83,3 +125,29 @@ def test_invalid_deps():
 
     c1 >> c3
     assert c1.depends_on == ["valid_dep"]
+
+
+def test_slots():
+    c = Command("Build", "build.sh")
+    assert not hasattr(c, "__dict__")
+    assert not hasattr(Wait(), "__dict__")
+    # public containers are mutable, and never shared between steps
+    other = Command("Test", "test.sh")
+    assert c.dependents is not other.dependents
+    other >> c
+    assert c.dependents == [other]
+    assert other.dependents == []
+    other.artifact_paths.append("out/*")
+    other.automatic_retries.append(AutomaticRetry(2))
+    other.properties["soft_fail"] = True
+    assert c.artifact_paths == [] and c.automatic_retries == [] and c.properties == {}
+
+    class Linux(Command):
+        env = {"OS": "linux"}
+        plugins = [Plugin("docker", {"image": "ubuntu"})]
+
+    linux = Linux("Lint", "lint.sh", env={"A": "1"})
+    assert linux.env == {"A": "1"}
+    d = linux.asdict()
+    assert d["env"] == {"OS": "linux", "A": "1"}
+    assert d["plugins"] == {"docker": {"image": "ubuntu"}}
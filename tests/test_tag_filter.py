@@ -0,0 +1,76 @@
+import pytest
+
+from kitefly import Command, GitFilter, Group, Pipeline, TagFilter
+
+
+class Slow(Command):
+    tags = ["slow"]
+
+
+def make_steps():
+    return [
+        Command("Smoke", "smoke.sh", tags=["smoke"]),
+        Slow("Smoke slow", "smoke-slow.sh", tags=["smoke"]),
+        Slow("Soak", "soak.sh"),
+        Command("Unit", "unit.sh", tags=["unit"]),
+        Command("Untagged", "untagged.sh"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "expression,expected",
+    [
+        ("smoke", ["smoke", "smoke_slow"]),
+        ("smoke & !slow", ["smoke"]),
+        ("!slow", ["smoke", "unit", "untagged"]),
+        ("unit | slow & !smoke", ["soak", "unit"]),
+        ("(unit | slow) & !smoke", ["soak", "unit"]),
+        ("!(smoke | unit)", ["soak", "untagged"]),
+        ("missing", []),
+    ],
+)
+def test_tag_filter(expression, expected):
+    steps = make_steps()
+    f = TagFilter(expression)
+    f.prepare(steps)
+    assert [s.key for s in f.select()] == expected
+    assert [s.key for s in steps if f(s)] == expected
+    # steps which weren't prepared are checked individually
+    assert [s.key for s in make_steps() if f(s)] == [f"{key}__kf__1" for key in expected]
+
+
+@pytest.mark.parametrize("expression", ["", "a &", "& a", "(a | b", "a b", "!", "a)"])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        TagFilter(expression)
+
+
+def test_tag_filter_in_pipeline():
+    steps = make_steps()
+    pipeline = Pipeline([Group(steps[:3], label="Smoke tests"), *steps[3:]])
+    f = TagFilter("smoke & !slow")
+    filtered = pipeline.filtered(f)
+    assert [s.key for s in filtered.steps[0].steps] == ["smoke"]
+    assert len(filtered.steps) == 1
+    assert len(f.index["smoke"]) == 2
+    # cheaper than the git filter, so evaluated first when combined
+    assert (GitFilter("main") & f).filters[0] is f
+
+
+@pytest.mark.parametrize("make_filter", [lambda: TagFilter("!slow"), lambda: ~TagFilter("slow")])
+def test_negated_tag_filter_excludes_groups(make_filter):
+    fast = Command("Fast", "fast.sh")
+    group = Group([fast, Slow("Slow", "slow.sh")], label="Tests")
+    f = make_filter()
+    filtered = Pipeline([group]).filtered(f)
+    assert len(filtered.steps) == 1
+    assert filtered.steps[0] is not group
+    assert [s.key for s in filtered.steps[0].steps] == ["fast"]
+    assert "slow.sh" not in filtered.asyaml()
+    # also when the group wasn't prepared
+    assert f(Group([Command("Other", "other.sh")])) is False
+    # the index can't be modified through the selected steps
+    tf = TagFilter("slow")
+    tf.prepare([Slow("Slow 2", "slow.sh")])
+    tf.selected.clear()
+    assert len(tf.index["slow"]) == 1
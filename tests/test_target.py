@@ -1,7 +1,7 @@
 import re
 import pytest
 
-from kitefly import Target
+from kitefly import Target, TargetCycleError, TargetGraph
 
 
 def test_target_matching():
@@ -42,3 +42,51 @@ def test_dependencies():
     assert len(t_md.dependencies) == 0
     assert t_md.matches("README.md")
     assert t_doc.matches("README.md")
+
+
+def test_diamond_dependencies():
+    lib = Target.src("lib")
+    app = Target.src("app")
+    svc = Target.src("svc")
+    top = Target.src("top")
+    app >> lib
+    svc >> lib
+    top >> app
+    top >> svc
+    assert top.dependencies == {app, svc, lib}
+    assert [p.glob.value for p in top._iterate_patterns()] == [
+        "top", "app", "lib", "svc"
+    ]
+    order = TargetGraph().resolve([top])
+    assert order.index(lib) < order.index(app) < order.index(top)
+    assert order.index(svc) < order.index(top)
+
+    # Adding an edge invalidates previously resolved closures
+    extra = Target.src("extra")
+    lib >> extra
+    assert extra in top.dependencies
+    assert top.matches("extra/file.txt")
+
+
+def test_dependency_cycle():
+    a = Target("a/**", name="a")
+    b = Target("b/**", name="b")
+    c = Target("c/**", name="c")
+    a >> b
+    b >> c
+    c >> a
+    with pytest.raises(TargetCycleError) as exc:
+        a.matches("a/file.txt")
+    assert exc.value.path == [a, b, c, a]
+    assert "a -> b -> c -> a" in str(exc.value)
+
+
+def test_negated_patterns():
+    app = Target.src("src/app", "!src/app/**/*.md")
+    assert app.matches("src/app/main.py")
+    assert not app.matches("src/app/docs/README.md")
+    assert str(app.patterns[1]).startswith("!r/")
+
+    lib = Target.src("lib")
+    app >> lib
+    assert app.matches("lib/README.md")
@@ -0,0 +1,85 @@
+import re
+
+from kitefly import Target, TargetSet
+
+
+def test_target_set_matched():
+    lib = Target.src("src/lib")
+    app = Target.src("src/app")
+    app >> lib
+    docs = Target("**/*.md")
+    py = Target(re.compile(r"(src|tests)/.*\.py"))
+    ts = TargetSet([app, docs, py])
+    assert len(ts) == 4
+    assert lib in ts
+
+    assert ts.matched(["src/lib/util.py"]) == {lib, app, py}
+    assert ts.matched(["README.md", "src/app/main.ts"]) == {docs, app}
+    assert ts.matched(["other/file.txt"]) == set()
+
+
+def test_target_set_agrees_with_target_matches():
+    targets = [
+        Target.src("a", "b/c"),
+        Target("**/*.py"),
+        Target(["a/**/test_*.py", "docs/*"]),
+        Target(re.compile(r".*\.json")),
+    ]
+    targets[2] >> targets[0]
+    files = ["a/x/test_y.py", "b/c.txt", "docs/index.md", "z.json", "q/r.py"]
+    ts = TargetSet(targets)
+    for i in range(len(files)):
+        subset = files[i:i + 2]
+        expected = {t for t in targets if any(t.matches(f) for f in subset)}
+        assert ts.matched(subset) == expected
+
+
+def test_target_set_glob_kinds():
+    exact = Target("src/lib")
+    prefix = Target("docs/**")
+    suffix = Target("**/*.go")
+    general = Target("config/*.{yml,yaml}")
+    negated = Target(["services/**", "!services/**/*.md"])
+    ts = TargetSet([exact, prefix, suffix, general, negated])
+    assert ts.matched(["src/lib/a/b.c"]) == {exact}
+    assert ts.matched(["src/library/b.c", "docs"]) == set()
+    assert ts.matched(["docs/x/y.md", "cmd/main.go"]) == {prefix, suffix}
+    assert ts.matched(["config/a.yaml", "config/a/b.yaml"]) == {general}
+    assert ts.matched(["services/a/README.md"]) == set()
+    assert ts.matched(["services/a/README.md", "services/a/main.go"]) == {negated, suffix}
+
+
+def test_target_set_classify():
+    lib = Target.src("lib")
+    app = Target(["app/**", "!app/**/*.md"])
+    app >> lib
+    docs = Target("**/*.md")
+    ts = TargetSet([app, docs])
+    files = ["lib/b.py", "app/x/README.md", "app/main.py", "lib/a.py", "lib/a.py"]
+    matches = ts.classify(files)
+    assert matches.matched == {lib, app, docs}
+    assert matches.own_files(app) == ["app/main.py"]
+    assert matches.files(app) == ["app/main.py", "lib/a.py", "lib/b.py"]
+    assert matches.files(docs) == ["app/x/README.md"]
+    assert app in matches
+
+    presorted = ts.classify(["docs/a.txt", "lib/c.py"], presorted=True)
+    assert presorted.matched == {lib, app}
+    assert app.match_many(files) == ["app/main.py", "lib/a.py", "lib/b.py"]
+
+
+def test_target_set_owner_ties():
+    backend = Target("services/**", name="backend")
+    frontend = Target("services/**", name="frontend")
+    files = ["services/api/main.py"]
+    for order in ([backend, frontend], [frontend, backend]):
+        matches = TargetSet(order).classify(files)
+        assert [a.target for a in matches.explain()] == [backend]
+        assert matches.owned == {backend}
+
+    # Targets which can't be told apart all own the file
+    first, second = Target("services/**"), Target("services/**")
+    matches = TargetSet([first, second]).classify(files)
+    assert matches.owned == {first, second}
+    owner = matches.owners[files[0]].target
+    assert {owner, *matches.shared[files[0]]} == {first, second}
@@ -0,0 +1,38 @@
+from kitefly import Command, NoopFilter, Pipeline, Step
+from kitefly import trace
+
+
+def test_trace_disabled_by_default():
+    assert not trace.enabled()
+    with trace.span("noop") as span:
+        assert span is None
+
+
+def test_trace_recording(capsys):
+    pipeline = Pipeline([Command("Build", "build.sh"), Command("Test", "test.sh")])
+    with trace.recording() as recorder:
+        pipeline.filtered(NoopFilter()).asyaml()
+    assert not trace.enabled()
+    assert set(recorder.timings) == {"filter", "resolve", "render.asdict", "render.yaml"}
+    assert recorder.counts["filter"] == 2
+    assert recorder.counts["render.yaml"] == 2
+    assert recorder.calls["resolve"] == 1
+    assert capsys.readouterr().out == ""
+
+
+def test_combined_parent_list_is_silent(capsys):
+    class Tagged(Command):
+        tags = ["a"]
+
+    assert Tagged("Tagged", "t.sh").combined_parent_list("tags") == ["a"]
+    assert capsys.readouterr().out == ""
+
+
+def test_trace_callback():
+    events = []
+    trace.add_callback(events.append)
+    try:
+        Pipeline([Command("Build", "build.sh")]).filtered(NoopFilter())
+    finally:
+        trace.remove_callback(events.append)
+    assert [(e.phase, e.items) for e in events] == [("filter", 1)]
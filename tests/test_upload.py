@@ -0,0 +1,65 @@
+import json
+import os
+import subprocess
+
+import pytest
+import yaml
+
+from kitefly import Command, Group, Pipeline, Wait
+from kitefly.upload import plan_chunks
+
+FAKE_AGENT = os.path.join(os.path.dirname(__file__), "bin", "buildkite-agent")
+
+
+def chunk_keys(chunks):
+    return [[s.get("key", "wait") for s in yaml.safe_load(c)["steps"]] for c in chunks]
+
+
+def test_chunks_respect_groups_and_waits():
+    a, b, c, d = (Command(name, f"{name}.sh") for name in "abcd")
+    pipeline = Pipeline([a, b, Wait(), c, Group([d, Command("e", "e.sh")], label="G")])
+    assert chunk_keys(pipeline.chunks(max_steps=4)) == [["a", "b"], ["wait", "c"], ["g"]]
+    # a Wait never ends a chunk
+    assert chunk_keys(pipeline.chunks(max_steps=3)) == [["a", "b"], ["wait", "c"], ["g"]]
+    assert chunk_keys(pipeline.chunks()) == [["a", "b", "wait", "c", "g"]]
+    documents = [yaml.safe_load(c)["steps"] for c in pipeline.chunks(max_steps=3)]
+    assert [s for doc in documents for s in doc] == pipeline.asdict()["steps"]
+
+
+def test_chunks_keep_forward_dependencies_together():
+    a, b, c, d = (Command(name, f"{name}.sh") for name in "abcd")
+    # a depends on c, which is uploaded after it
+    a >> c
+    d >> a
+    pipeline = Pipeline([a, b, c, d])
+    assert chunk_keys(pipeline.chunks(max_steps=1)) == [["a", "b", "c"], ["d"]]
+
+
+def test_plan_chunks_max_bytes():
+    steps = [Command(name, f"{name}.sh") for name in "abcd"]
+    assert plan_chunks(steps, [10, 10, 10, 10], max_bytes=25) == [(0, 2), (2, 4)]
+
+
+def test_write_chunks(tmp_path):
+    pipeline = Pipeline([Command(name, f"{name}.sh") for name in "abc"])
+    paths = pipeline.write_chunks(str(tmp_path), max_steps=2)
+    assert [os.path.basename(p) for p in paths] == ["pipeline-001.yml", "pipeline-002.yml"]
+    with open(paths[1]) as stream:
+        assert yaml.safe_load(stream)["steps"][0]["key"] == "c"
+
+
+def test_upload_chunks(tmp_path, monkeypatch):
+    log = tmp_path / "agent.log"
+    monkeypatch.setenv("FAKE_BUILDKITE_AGENT_LOG", str(log))
+    pipeline = Pipeline([Command(name, f"{name}.sh") for name in "abc"])
+    assert pipeline.upload_chunks(FAKE_AGENT, ["--no-interpolation"], max_steps=2) == 2
+    uploads = [json.loads(line) for line in log.read_text().splitlines()]
+    assert [u["args"] for u in uploads] == [["pipeline", "upload", "--no-interpolation"]] * 2
+    assert [u["stdin"] for u in uploads] == pipeline.chunks(max_steps=2)
+
+    # remaining chunks are not uploaded after a failure
+    log.unlink()
+    monkeypatch.setenv("FAKE_BUILDKITE_AGENT_REJECT", "a.sh")
+    with pytest.raises(subprocess.CalledProcessError):
+        pipeline.upload_chunks(FAKE_AGENT, max_steps=2)
+    assert len(log.read_text().splitlines()) == 1
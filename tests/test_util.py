@@ -1,4 +1,17 @@
-from kitefly.util import generate_key, as_iterable
+import pytest
+
+import threading
+
+from kitefly import Command
+from kitefly.util import (
+    KEY_COUNT,
+    Glob,
+    KeyRegistry,
+    as_iterable,
+    compile_glob,
+    generate_key,
+    key_scope,
+)
 
 
 def test_generate_key():
@@ -6,6 +19,84 @@ def test_generate_key():
     assert generate_key("Some   Label") == "some_label__kf__1"
 
 
+def test_key_scope():
+    Command("Build", "build.sh")
+    with key_scope() as registry:
+        assert Command("Build", "build.sh").key == "build"
+        assert Command("Build", "build.sh").key == "build__kf__1"
+    assert registry.counts == {"build": 2}
+    assert KEY_COUNT == {"build": 1}
+    assert Command("Build", "build.sh").key == "build__kf__1"
+
+
+def test_key_scope_stable():
+    def keys():
+        with key_scope(stable=True):
+            return [
+                Command("Build", "build.sh").key,
+                Command("Build", "make").key,
+                Command("Build", "make").key,
+            ]
+
+    build, make, make_2 = keys()
+    assert build.startswith("build__") and build != make
+    assert make_2 == make + "__2"
+    # keys don't depend on other steps created before them
+    with key_scope(stable=True):
+        Command("Lint", "lint.sh")
+        assert Command("Build", "make").key == make
+    assert keys() == [build, make, make_2]
+
+
+def test_key_registry_threads():
+    registry = KeyRegistry()
+    keys = []
+
+    def generate():
+        keys.extend(registry.generate("Test") for _ in range(1000))
+
+    threads = [threading.Thread(target=generate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(keys)) == 4000
+
+
 def test_as_iterable():
     assert as_iterable([1]) == [1]
     assert as_iterable(True) == (True,)
+
+
+@pytest.mark.parametrize(
+    "pattern,kind,matching,not_matching",
+    [
+        ("src/lib", Glob.EXACT, ["src/lib", "src/lib/a.py"], ["src/library/a.py", "src"]),
+        ("src/lib/", Glob.PREFIX, ["src/lib/a.py"], ["src/lib", "src/lib-v2/a.py"]),
+        ("docs/**", Glob.PREFIX, ["docs/a/b.md"], ["docs", "a/docs/b.md"]),
+        ("**/*.py", Glob.SUFFIX, ["a.py", "a/b/c.py"], ["a.pyc", "a/py"]),
+        ("src/*.py", Glob.REGEX, ["src/a.py"], ["src/a.pyc", "src/a/b.py"]),
+        ("**/Makefile", Glob.REGEX, ["Makefile", "a/Makefile"], ["a/NotMakefile"]),
+        ("a/**/b/*.txt", Glob.REGEX, ["a/b/c.txt", "a/x/y/b/c.txt"], ["a/xb/c.txt"]),
+        ("file?.txt", Glob.REGEX, ["file1.txt"], ["file12.txt", "file/.txt"]),
+        ("[ab]*.md", Glob.REGEX, ["a.md", "bcd.md"], ["c.md"]),
+        ("[!ab]*.md", Glob.REGEX, ["c.md"], ["a.md", "/x.md"]),
+        ("{src,lib}/**/*.{ts,tsx}", Glob.REGEX, ["src/a.ts", "lib/b/c.tsx"], ["app/a.ts", "src/a.js"]),
+    ],
+)
+def test_compile_glob(pattern, kind, matching, not_matching):
+    compiled = compile_glob(pattern)
+    assert compiled.kind == kind
+    for filepath in matching:
+        assert compiled.matches(filepath)
+        assert compiled.regex.fullmatch(filepath)
+    for filepath in not_matching:
+        assert not compiled.matches(filepath)
+        assert not compiled.regex.fullmatch(filepath)
+
+
+def test_compile_glob_cache():
+    assert compile_glob("**/*.md") is compile_glob("**/*.md")
+    negated = compile_glob("!vendor/**")
+    assert negated.negated and negated.kind == Glob.PREFIX
+    assert negated.matches("vendor/x.go")